@@ -7,7 +7,6 @@ from telegram.ext import (
     CallbackContext,
     ContextTypes,
 )
-from telegram.constants import ChatMemberStatus
 from telegram.error import BadRequest, TelegramError
 import logging
 import os
@@ -18,10 +17,15 @@ from misc import (
     GROUP_ID2,
 )
 from bot.utils.chatgpt_integration import generate_chat_response
-from bot.utils.audio_demo_creator import create_audio_demo
-from bot.utils.audio_demo_creator import ProgressUploader
-from bot.utils.audio_demo_creator import DOWNLOAD_PATH
 from bot.utils.audio_demo_creator import last_demo_messages
+from bot.utils.audio_demo_creator import DEMO_DURATION
+from bot.utils.audio_demo_creator import demo_cache_key, send_cached_demo
+from bot.utils.audio_demo_creator import delete_previous_demo, file_payload
+from bot.utils.download_queue import download_queue
+from bot.utils.permissions import is_chat_admin
+from bot.utils.admin_roster import admin_roster
+from bot.utils.message_index import message_index, delete_messages_batched
+from bot.utils.report_aggregator import report_aggregator, ADDED, DUPLICATE
 
 
 logging.basicConfig(
@@ -32,12 +36,7 @@ ALLOWED_GROUP_IDS = [GROUP_ID, GROUP_ID2, TEST_GROUP_ID]
 
 
 async def is_user_admin(chat_id: int, user_id: int, context: CallbackContext) -> bool:
-    try:
-        member = await context.bot.get_chat_member(chat_id, user_id)
-        return member.status in ["administrator", "creator"]
-    except Exception as e:
-        logging.error(f"Error checking admin status: {e}")
-        return False
+    return await is_chat_admin(context.bot, chat_id, user_id)
 
 
 def is_allowed_group(chat_id: int) -> bool:
@@ -64,7 +63,8 @@ async def help(update: Update, context: CallbackContext) -> None:
         f"<code>/mute 10m</code> - میوت کردن کاربر در زمان مشخص شده - 30m, 2h, 1d\n\n"
         f"<code>/unmute</code> - آنمیوت کردن\n\n"
         f"<code>/del</code> - حذف پیام\n\n"
-        f"<code>/del 10</code> - حذف 10 پیام\n\n"
+        f"<code>/del 10</code> - حذف 10 پیام آخر گروه (بدون نیاز به ریپلای)\n\n"
+        f"<code>/purge</code> - حذف همه پیام‌های اخیر کاربر\n\n"
         f"<code>/report</code> - گزارش به ادمین‌ها\n\n"
         f"<code>/pin</code> - سنجاق کردن پیام\n\n"
         f"<code>/unpin</code> - از سنجاق خارج کردن\n\n"
@@ -72,7 +72,9 @@ async def help(update: Update, context: CallbackContext) -> None:
         f"توجه: تمام دستورات به جز آخری باید با پاسخ به پیام کاربر ارسال شوند!\n\n"
         f"<code>/admins</code> - نمایش همه ادمین‌ها\n\n\n"
         f"<code>/chat</code> - چت با بات\n\n"
-        f"با فرستادن لینک یوتیوب، به صورت خودکار دانلود می شود.\n\n\n"
+        f"با فرستادن لینک یوتیوب، مشخصات ویدیو نمایش داده می‌شود و با دکمه‌های آن "
+        f"می‌توانید صدا یا کیفیت دلخواه را دانلود کنید.\n\n"
+        f"<code>/audio</code> (لینک) - دانلود فقط صدای ویدیوی یوتیوب\n\n\n"
         f"<i>توسعه داده شده توسط ایماگو</i>",
         parse_mode="HTML",
     )
@@ -183,11 +185,7 @@ async def mute(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     replied_user = update.message.reply_to_message.from_user
     admin = update.effective_user
 
-    chat_member = await context.bot.get_chat_member(update.effective_chat.id, admin.id)
-    if chat_member.status not in [
-        ChatMemberStatus.ADMINISTRATOR,
-        ChatMemberStatus.OWNER,
-    ]:
+    if not await is_user_admin(update.effective_chat.id, admin.id, context):
         await update.message.reply_text("این دستور فقط برای ادمین‌ها قابل دسترسی است.")
         return
 
@@ -252,11 +250,7 @@ async def unmute(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     replied_user = update.message.reply_to_message.from_user
     admin = update.effective_user
 
-    chat_member = await context.bot.get_chat_member(update.effective_chat.id, admin.id)
-    if chat_member.status not in [
-        ChatMemberStatus.ADMINISTRATOR,
-        ChatMemberStatus.OWNER,
-    ]:
+    if not await is_user_admin(update.effective_chat.id, admin.id, context):
         await update.message.reply_text("این دستور فقط برای ادمین‌ها قابل دسترسی است.")
         return
 
@@ -299,15 +293,29 @@ async def delete_message(update: Update, context: CallbackContext) -> None:
         return
 
     admin = update.effective_user
-    chat_member = await context.bot.get_chat_member(update.effective_chat.id, admin.id)
 
-    if chat_member.status not in [
-        ChatMemberStatus.ADMINISTRATOR,
-        ChatMemberStatus.OWNER,
-    ]:
+    if not await is_user_admin(update.effective_chat.id, admin.id, context):
         await update.message.reply_text("این دستور فقط برای ادمین‌ها قابل دسترسی است.")
         return
 
+    if context.args:
+        try:
+            count = int(context.args[0])
+        except ValueError:
+            count = 0
+        if count < 1:
+            await update.message.reply_text("لطفاً یک عدد صحیح برای تعداد پیام‌ها وارد کنید.")
+            return
+
+        chat_id = update.effective_chat.id
+        message_ids = message_index.last(chat_id, count, before=update.message.message_id)
+        deleted = await delete_messages_batched(
+            context.bot, chat_id, [update.message.message_id] + message_ids
+        )
+        if not deleted:
+            await update.message.reply_text("خطایی در حذف پیام‌ها رخ داد.")
+        return
+
     if update.message.reply_to_message:
         try:
             await context.bot.delete_message(
@@ -319,6 +327,45 @@ async def delete_message(update: Update, context: CallbackContext) -> None:
             await update.message.reply_text("خطایی در حذف پیام رخ داد.")
 
 
+async def purge(update: Update, context: CallbackContext) -> None:
+    if update.effective_chat.id not in ALLOWED_GROUP_IDS:
+        await update.message.reply_text("این گروه، گروه تایپولوژی نیست.")
+        return
+
+    if not await is_user_admin(update.effective_chat.id, update.effective_user.id, context):
+        await update.message.reply_text("این دستور فقط برای ادمین‌ها قابل دسترسی است.")
+        return
+
+    if not update.message.reply_to_message:
+        await update.message.reply_text(
+            "این دستور باید با ریپلای به پیام کاربر ارسال شود."
+        )
+        return
+
+    chat_id = update.effective_chat.id
+    target = update.message.reply_to_message.from_user
+    # Anonymous admins and channels post under a shared placeholder user,
+    # so purging one would purge them all.
+    if update.message.reply_to_message.sender_chat or await is_user_admin(chat_id, target.id, context):
+        await update.message.reply_text("نمی‌توانید پیام‌های یک ادمین را پاک کنید.")
+        return
+
+    message_ids = message_index.from_user(chat_id, target.id)
+    deleted = await delete_messages_batched(
+        context.bot,
+        chat_id,
+        [update.message.message_id, update.message.reply_to_message.message_id] + message_ids,
+    )
+    if deleted:
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=f"پیام‌های کاربر [{target.full_name}](tg://user?id={target.id}) حذف شد.",
+            parse_mode="Markdown",
+        )
+    else:
+        await update.message.reply_text("خطایی در حذف پیام‌ها رخ داد.")
+
+
 async def pin_message(update: Update, context: CallbackContext) -> None:
     if update.effective_chat.id not in ALLOWED_GROUP_IDS:
         await update.message.reply_text("این گروه، گروه تایپولوژی نیست.")
@@ -392,10 +439,7 @@ async def report(update: Update, context: CallbackContext) -> None:
     reported_user = update.message.reply_to_message.from_user
     reported_by = update.message.from_user
 
-    reported_user_chat_member = await context.bot.get_chat_member(
-        update.effective_chat.id, reported_user.id
-    )
-    if reported_user_chat_member.status in ("administrator", "creator"):
+    if await is_user_admin(update.effective_chat.id, reported_user.id, context):
         await update.message.reply_text("نمی‌توانید یک ادمین را گزارش دهید.")
         return
 
@@ -403,25 +447,17 @@ async def report(update: Update, context: CallbackContext) -> None:
         await update.message.reply_text("نمی‌توانید خودتان را گزارش دهید.")
         return
 
-    admins = await context.bot.get_chat_administrators(update.effective_chat.id)
-
-    admin_mentions = [
-        f"[ ](tg://user?id={admin.user.id})"
-        for admin in admins
-        if not admin.user.is_bot
-    ]
-
     try:
-        admin_mentions_text = "".join(admin_mentions)
-
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text=f"{admin_mentions_text}\n"
-            f"کاربر "
-            f"[{reported_user.full_name}](tg://user?id={reported_user.id}) گزارش شد.",
-            parse_mode="Markdown",
+        result = await report_aggregator.report(
+            context.bot, update.effective_chat.id, reported_user, reported_by.id,
+            update.message.reply_to_message.message_id,
         )
-        await update.message.reply_text("گزارش شما ارسال شد.")
+        if result == DUPLICATE:
+            await update.message.reply_text("شما قبلاً این کاربر را گزارش داده‌اید.")
+        elif result == ADDED:
+            await update.message.reply_text("گزارش شما به گزارش قبلی این کاربر اضافه شد.")
+        else:
+            await update.message.reply_text("گزارش شما ارسال شد.")
     except Exception as e:
         logging.error(f"Error reporting user: {e}")
         await update.message.reply_text("خطایی در گزارش کاربر رخ داد.")
@@ -429,9 +465,9 @@ async def report(update: Update, context: CallbackContext) -> None:
 
 async def get_admins(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     try:
-        admins = await context.bot.get_chat_administrators(update.effective_chat.id)
+        admins = await admin_roster.admins(context.bot, update.effective_chat.id)
         admin_info = []
-        for admin in admins:
+        for admin in admins.values():
             status = "creator" if admin.status == "creator" else "admin"
             admin_info.append(f"{admin.user.full_name} - {status}")
         admin_list = "\n".join(admin_info)
@@ -495,35 +531,22 @@ async def from_command(update: Update, context: CallbackContext) -> None:
     file_id = audio.file_id
     file_name = audio.file_name or f"audio_{file_id}.mp3"
     title = audio.title or audio.performer or os.path.splitext(file_name)[0]
-
-    file = await context.bot.get_file(file_id)
-    file_path = f"{DOWNLOAD_PATH}/{file_name}"
-    await file.download_to_drive(custom_path=file_path)
-
-    loading_message = await update.message.reply_text("در حال ایجاد فایل صوتی...")
-    demo_duration = min(30, duration - start_time)
-    demo_path, demo_size = create_audio_demo(file_path, start_time, demo_duration)
-
-    if update.effective_user.id in last_demo_messages:
-        try:
-            await context.bot.delete_message(
-                chat_id=update.effective_chat.id,
-                message_id=last_demo_messages[update.effective_user.id]
-            )
-        except Exception as e:
-            logging.error(f"Error deleting previous demo: {e}")
-
-    uploader = ProgressUploader(demo_path)
-    demo_message = await uploader.upload(
-        context.bot,
-        update.message.chat_id,
-        caption=f"دموی {title} (from {start_time}s)",
-        as_voice=True
-    )
-    
-    await context.bot.delete_message(chat_id=update.message.chat_id, message_id=loading_message.message_id)
-
-    last_demo_messages[update.effective_user.id] = demo_message.message_id
-
-    os.remove(file_path)
-    os.remove(demo_path)
\ No newline at end of file
+    demo_duration = min(DEMO_DURATION, duration - start_time)
+    caption = f"دموی {title} (from {start_time}s)"
+
+    cache_key = demo_cache_key(audio.file_unique_id, start_time, demo_duration)
+    demo_message = await send_cached_demo(context.bot, update.message.chat_id, cache_key, caption)
+    if demo_message:
+        await delete_previous_demo(context.bot, update.message.chat_id, update.effective_user.id)
+        last_demo_messages[update.effective_user.id] = demo_message.message_id
+        return
+
+    await download_queue.submit(context.bot, update.message, "audio_demo", {
+        "file": file_payload(audio),
+        "title": title,
+        "start": start_time,
+        "duration": demo_duration,
+        "caption": caption,
+        "cache_key": cache_key,
+        "replace_previous": True,
+    }, "در حال ایجاد فایل صوتی...")
\ No newline at end of file
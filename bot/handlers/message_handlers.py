@@ -1,8 +1,11 @@
 from telegram import Update
 from telegram.ext import CallbackContext
-from bot.utils.youtube_downloader import is_youtube_link
-from bot.utils.youtube_downloader import download_youtube_video_handler
-from bot.utils.audio_demo_creator import handle_audio_file
+from bot.utils.link_extractor import has_youtube_link
+from bot.utils.youtube_downloader import youtube_link_handler
+from bot.utils.audio_demo_creator import handle_audio_batch
+from bot.utils.album_batcher import audio_batcher
+from bot.utils.admin_roster import admin_roster
+from bot.utils.message_index import message_index
 
 async def greet_new_member(update: Update, context: CallbackContext) -> None:
     if context.bot.username in update.message.text:
@@ -28,10 +31,22 @@ async def say_goodbye(update: Update, context: CallbackContext) -> None:
             )
 
 
+async def record_message(update: Update, context: CallbackContext) -> None:
+    message = update.effective_message
+    if message is None:
+        return
+    user_id = message.from_user.id if message.from_user else 0
+    message_index.record(message.chat_id, message.message_id, user_id)
+
+
+async def track_admin_changes(update: Update, context: CallbackContext) -> None:
+    admin_roster.member_changed(update.chat_member or update.my_chat_member)
+
+
 async def handle_message(update: Update, context: CallbackContext) -> None:
     if update.message.text:
         text = update.message.text
-        if is_youtube_link(text):
-            await download_youtube_video_handler(update, context)
+        if has_youtube_link(text):
+            await youtube_link_handler(update, context)
     elif update.message.audio or (update.message.document and update.message.document.mime_type == 'audio/mpeg'):
-        await handle_audio_file(update, context)
\ No newline at end of file
+        audio_batcher.add(update, context, handle_audio_batch)
\ No newline at end of file
@@ -0,0 +1,80 @@
+import logging
+import time
+
+from telegram.constants import ChatMemberStatus
+from telegram.error import TelegramError
+
+from bot.utils.single_flight import SingleFlight
+
+ADMIN_ROSTER_TTL = 10 * 60
+ADMIN_STATUSES = (ChatMemberStatus.ADMINISTRATOR, ChatMemberStatus.OWNER)
+
+class AdminRosterCache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._rosters = {}
+        self._generations = {}
+        self._loads = SingleFlight()
+
+    async def _load(self, bot, chat_id):
+        generation = self._generations.get(chat_id, 0)
+        members = await bot.get_chat_administrators(chat_id)
+        roster = {member.user.id: member for member in members}
+        # An invalidation that landed during the call means this roster may
+        # predate the change; answer with it but do not cache it.
+        if self._generations.get(chat_id, 0) == generation:
+            self._rosters[chat_id] = (time.monotonic(), roster)
+        return roster
+
+    async def admins(self, bot, chat_id):
+        # One get_chat_administrators call fills the roster for a chat; until
+        # it expires or a chat_member update invalidates it, every lookup is
+        # answered from memory.
+        entry = self._rosters.get(chat_id)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        # Keyed by generation too, so lookups after an invalidation start a
+        # fresh load instead of joining one that began before it.
+        generation = self._generations.get(chat_id, 0)
+        roster, _ = await self._loads.do((chat_id, generation), lambda: self._load(bot, chat_id))
+        return roster
+
+    async def is_admin(self, bot, chat_id, user_id):
+        try:
+            roster = await self.admins(bot, chat_id)
+        except TelegramError as e:
+            # Private chats have no administrators to list.
+            logging.error(f"Error loading admins of {chat_id}: {e}")
+            return False
+        member = roster.get(user_id)
+        return member is not None and member.status in ADMIN_STATUSES
+
+    def invalidate(self, chat_id):
+        self._generations[chat_id] = self._generations.get(chat_id, 0) + 1
+        if self._rosters.pop(chat_id, None) is not None:
+            self.invalidations += 1
+
+    def member_changed(self, chat_member_updated):
+        # Promotions, demotions and admins leaving all pass through an admin
+        # status on one side of the change.
+        old_status = chat_member_updated.old_chat_member.status
+        new_status = chat_member_updated.new_chat_member.status
+        if old_status in ADMIN_STATUSES or new_status in ADMIN_STATUSES:
+            self.invalidate(chat_member_updated.chat.id)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "chats": len(self._rosters),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+admin_roster = AdminRosterCache(ttl=ADMIN_ROSTER_TTL)
@@ -0,0 +1,42 @@
+import asyncio
+import logging
+
+ALBUM_COLLECT_WINDOW = 1.5
+
+class UpdateBatcher:
+    def __init__(self, window):
+        self.window = window
+        self._batches = {}
+        self._tasks = set()
+
+    def _spawn(self, coroutine):
+        # The loop only keeps weak references to tasks; hold them until done.
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def add(self, update, context, on_batch):
+        # Only albums share a media_group_id and are worth waiting for; a
+        # lone file is handled right away.
+        group_id = update.message.media_group_id
+        if not group_id:
+            self._spawn(self._flush([update], f"message:{update.message.message_id}", context, on_batch))
+            return
+        key = f"album:{group_id}"
+        if key in self._batches:
+            self._batches[key].append(update)
+            return
+        self._batches[key] = [update]
+        self._spawn(self._flush_later(key, context, on_batch))
+
+    async def _flush_later(self, key, context, on_batch):
+        await asyncio.sleep(self.window)
+        await self._flush(self._batches.pop(key), key, context, on_batch)
+
+    async def _flush(self, updates, key, context, on_batch):
+        try:
+            await on_batch(updates, context)
+        except Exception as e:
+            logging.error(f"Error processing batch {key}: {e}")
+
+audio_batcher = UpdateBatcher(ALBUM_COLLECT_WINDOW)
@@ -1,27 +1,83 @@
 from pydub import AudioSegment
-from telegram import Update, InputFile
+from telegram import Update, InputMediaAudio, Document
+from telegram.error import BadRequest
 from telegram.ext import CallbackContext
 import os
-import time
+from pathlib import Path
 import logging
-from tqdm import tqdm
 import asyncio
 import subprocess
+import httpx
+from bot.utils.transcoder import transcode_service, TranscodeQueueFull
+from bot.utils.cache import PersistentLRUCache, CACHE_PATH
+from bot.utils.source_cache import source_cache, probe_audio
+from bot.utils.transfer import transfer_service
+from bot.utils.demo_selection import select_demo_start
+from bot.utils.download_queue import download_queue
+from bot.utils.status_message import StatusMessage
+from bot.utils.scratch import scratch_space
+from bot.utils.single_flight import SingleFlight
+from bot.utils.cooldown import CooldownManager
 
-DOWNLOAD_PATH = 'downloads/'
-
-cooldown_users_audio = {}
 COOLDOWN_TIME_AUDIO = 10
+audio_cooldown = CooldownManager(COOLDOWN_TIME_AUDIO)
 
 MAX_VOICE_SIZE = 50 * 1024 * 1024
 MAX_FILE_SIZE = 20 * 1024 * 1024
 
 last_demo_messages = {}
 
-def sanitize_filename(filename):
-    return "".join(c for c in filename if c.isalnum() or c in (' ', '.', '_')).rstrip()
+DEMO_DURATION = 30
+# Optional: cut demos from the most energetic window instead of the start.
+# It needs the whole file on disk, so it turns off the streaming pipeline.
+SMART_DEMO_START = False
+ALBUM_CONCURRENCY = 3
+MEDIA_GROUP_LIMIT = 10
+DEMO_CACHE_MAX_ENTRIES = 5000
+# Scratch bytes reserved per demo; a 30 s Opus clip is well under this.
+DEMO_SCRATCH_RESERVE = 2 * 1024 * 1024
+
+source_flights = SingleFlight()
+demo_cache = PersistentLRUCache(os.path.join(CACHE_PATH, 'demo_cache.json'), DEMO_CACHE_MAX_ENTRIES)
+
+FFMPEG_BINARY = 'ffmpeg'
+DEMO_AUDIO_CODEC = 'libopus'
+DEMO_AUDIO_BITRATE = '64k'
+# Voice notes must be Opus in Ogg, but sendMediaGroup audio only plays MP3
+# and M4A, so album demos are encoded as AAC in M4A.
+DEMO_ENCODINGS = {
+    "ogg": (DEMO_AUDIO_CODEC, DEMO_AUDIO_BITRATE, "ogg"),
+    "m4a": ("aac", "96k", "ipod"),
+}
+
+STREAMING_PIPELINE = True
+STREAM_CHUNK_SIZE = 64 * 1024
+# Containers ffmpeg can decode from a pipe; MP4/M4A keep their index at the
+# end of the file more often than not and need a seekable input.
+STREAMABLE_EXTENSIONS = ('.mp3', '.ogg', '.oga', '.opus', '.flac', '.wav', '.aac')
 
-def create_audio_demo(file_path, start_time, duration):
+def demo_encoder_command(source, output, start_time, duration, audio_format="ogg"):
+    codec, bitrate, container = DEMO_ENCODINGS[audio_format]
+    # -ss/-t before -i seek inside the container and stop reading after the
+    # window, so only [start, start + duration] is ever decoded.
+    return [
+        FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y",
+        "-ss", str(start_time),
+        "-t", str(duration),
+        "-i", source,
+        "-map", "0:a:0",
+        "-vn", "-ac", "1",
+        "-c:a", codec,
+        "-b:a", bitrate,
+        "-f", container,
+        output,
+    ]
+
+def cut_audio_demo(file_path, demo_path, start_time, duration, timeout=None, audio_format="ogg"):
+    command = demo_encoder_command(file_path, demo_path, start_time, duration, audio_format)
+    subprocess.run(command, check=True, capture_output=True, timeout=timeout)
+
+def create_audio_demo_pydub(file_path, demo_path, start_time, duration, audio_format="ogg"):
     try:
         audio = AudioSegment.from_file(file_path)
     except:
@@ -36,117 +92,372 @@ def create_audio_demo(file_path, start_time, duration):
     start_ms = start_time * 1000
     duration_ms = duration * 1000
     demo_audio = audio[start_ms:start_ms + duration_ms]
-    demo_path = file_path.rsplit('.', 1)[0] + f"_demo_{start_time}s.ogg"
-    demo_audio.export(demo_path, format="ogg")
+    codec, bitrate, container = DEMO_ENCODINGS[audio_format]
+    demo_audio.export(demo_path, format=container, codec=codec, bitrate=bitrate)
+
+def create_audio_demo(file_path, start_time, duration, timeout=None, output_dir=None, audio_format="ogg"):
+    demo_path = file_path.rsplit('.', 1)[0] + f"_demo_{start_time}s.{audio_format}"
+    if output_dir is not None:
+        demo_path = os.path.join(output_dir, os.path.basename(demo_path))
+    try:
+        cut_audio_demo(file_path, demo_path, start_time, duration, timeout=timeout, audio_format=audio_format)
+    except (OSError, subprocess.CalledProcessError) as e:
+        logging.warning(f"Seek-and-cut failed for {file_path}, falling back to pydub: {e}")
+        create_audio_demo_pydub(file_path, demo_path, start_time, duration, audio_format)
     demo_size = os.path.getsize(demo_path)
     return demo_path, demo_size
 
+def demo_cache_key(file_unique_id, start_time, duration):
+    return f"{file_unique_id}:{start_time}:{duration}"
+
+async def send_cached_demo(bot, chat_id, cache_key, caption):
+    cached = demo_cache.get(cache_key)
+    if cached is None:
+        return None
+    try:
+        if cached["kind"] == "voice":
+            return await bot.send_voice(chat_id=chat_id, voice=cached["file_id"], caption=caption)
+        return await bot.send_document(chat_id=chat_id, document=cached["file_id"], caption=caption)
+    except BadRequest as e:
+        logging.warning(f"Cached demo {cache_key} rejected, dropping it: {e}")
+        demo_cache.delete(cache_key)
+        return None
+
+def remember_demo(cache_key, message):
+    if message.audio:
+        demo_cache.set(cache_key, {"kind": "audio", "file_id": message.audio.file_id})
+    elif message.voice:
+        demo_cache.set(cache_key, {"kind": "voice", "file_id": message.voice.file_id})
+    elif message.document:
+        demo_cache.set(cache_key, {"kind": "document", "file_id": message.document.file_id})
+
+async def run_demo_pipeline(chunks, start_time, duration):
+    command = demo_encoder_command("pipe:0", "pipe:1", start_time, duration)
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+    async def feed():
+        try:
+            async for chunk in chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg closes its stdin once the demo window has been read,
+            # so the rest of the track is never transferred.
+            pass
+        finally:
+            process.stdin.close()
+
+    try:
+        _, output, errors = await asyncio.gather(
+            feed(), process.stdout.read(), process.stderr.read()
+        )
+        await process.wait()
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        raise
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, output, errors)
+    return output
+
+async def iter_telegram_file(bot, file_id):
+    file_obj = await bot.get_file(file_id)
+    async with httpx.AsyncClient(timeout=60) as client:
+        async with client.stream("GET", file_obj.file_path) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                yield chunk
+
+def can_stream_demo(file):
+    extension = os.path.splitext(file.file_name or "")[1].lower()
+    return (
+        STREAMING_PIPELINE
+        and not SMART_DEMO_START
+        and extension in STREAMABLE_EXTENSIONS
+        and file.file_unique_id not in source_cache
+    )
+
+async def stream_audio_demo(bot, file, start_time, duration, chat_id):
+    async with transcode_service.slot(), transfer_service.slot(chat_id, file.file_size or 0):
+        chunks = iter_telegram_file(bot, file.file_id)
+        try:
+            return await asyncio.wait_for(
+                run_demo_pipeline(chunks, start_time, duration),
+                transcode_service.job_timeout,
+            )
+        finally:
+            await chunks.aclose()
+
+async def download_source_audio(bot, file, chat_id):
+    extension = os.path.splitext(file.file_name or "")[1] or ".mp3"
+    path = source_cache.path_for(file.file_unique_id, extension)
+    await transfer_service.download(bot, file, path, chat_id)
+    try:
+        metadata = await asyncio.to_thread(probe_audio, path)
+    except (OSError, ValueError, subprocess.SubprocessError) as e:
+        logging.warning(f"Could not probe {path}: {e}")
+        metadata = {}
+    return source_cache.add(file.file_unique_id, path, metadata)
+
+async def fetch_source_audio(bot, file, chat_id):
+    entry = source_cache.get(file.file_unique_id)
+    if entry:
+        return entry
+    # Concurrent demos of one file would otherwise download into the same
+    # cache path at once.
+    entry, _ = await source_flights.do(
+        file.file_unique_id, lambda: download_source_audio(bot, file, chat_id)
+    )
+    return entry
+
+def clamp_demo_start(start_time, duration, track_duration):
+    # A start past the end of the track would cut an empty demo.
+    if track_duration and start_time + duration > track_duration:
+        return max(0, int(track_duration - duration))
+    return start_time
+
+async def pick_demo_start(source):
+    metadata = source["metadata"]
+    if "best_start" not in metadata:
+        try:
+            metadata["best_start"] = await transcode_service.run(
+                select_demo_start, source["path"], DEMO_DURATION, metadata.get("duration"),
+                timeout=transcode_service.job_timeout,
+            )
+        except Exception as e:
+            logging.warning(f"Smart demo start failed for {source['path']}, cutting from 0: {e}")
+            return 0
+    return metadata["best_start"]
+
+def get_audio_file(message):
+    if message.audio:
+        file = message.audio
+        return file, file.title or file.performer or file.file_name or f"audio_{file.file_id}"
+    if message.document and message.document.mime_type == 'audio/mpeg':
+        return message.document, message.document.file_name
+    return None, None
+
+def file_payload(file):
+    return {
+        "file_id": file.file_id,
+        "file_unique_id": file.file_unique_id,
+        "file_name": file.file_name,
+        "file_size": file.file_size,
+    }
+
 async def handle_audio_file(update: Update, context: CallbackContext) -> None:
     user_id = update.message.from_user.id
-    if user_id in cooldown_users_audio and (time.time() - cooldown_users_audio[user_id]) < COOLDOWN_TIME_AUDIO:
-        remaining_time = COOLDOWN_TIME_AUDIO - (time.time() - cooldown_users_audio[user_id])
+    remaining_time = audio_cooldown.claim(user_id)
+    if remaining_time:
         await update.message.reply_text(f"لطفاً {remaining_time:.0f} ثانیه صبر کنید.")
         return
 
-    if update.message.audio:
-        file = update.message.audio
-        title = file.title or file.performer or file.file_name or f"audio_{file.file_id}"
-    elif update.message.document and update.message.document.mime_type == 'audio/mpeg':
-        file = update.message.document
-        title = file.file_name
-    else:
+    file, title = get_audio_file(update.message)
+    if file is None:
+        audio_cooldown.release(user_id)
         await update.message.reply_text("لطفاً یک فایل صوتی ارسال کنید.")
         return
 
-    file_id = file.file_id
-    file_name = sanitize_filename(title + os.path.splitext(file.file_name)[-1])
-    file_path = f"{DOWNLOAD_PATH}/{file_name}"
+    cache_key = demo_cache_key(file.file_unique_id, "auto" if SMART_DEMO_START else 0, DEMO_DURATION)
+    demo_message = await send_cached_demo(context.bot, update.message.chat_id, cache_key, f"{title}")
+    if demo_message:
+        last_demo_messages[update.effective_user.id] = demo_message.message_id
+        return
 
     if file.file_size > MAX_FILE_SIZE:
+        audio_cooldown.release(user_id)
         await update.message.reply_text("این فایل بسیار بزرگ است. لطفاً یک فایل کوچکتر ارسال کنید.")
         return
 
-    try:
-        file_obj = await context.bot.get_file(file_id)
-        await file_obj.download_to_drive(custom_path=file_path)
-        
-        await create_audio_demo_handler(update, context, file_path, title)
-    except Exception as e:
-        logging.error(f"Error downloading or processing file: {e}")
-        await update.message.reply_text(f"خطا در دانلود یا پردازش فایل: {e}")
-    finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-
-async def create_audio_demo_handler(update: Update, context: CallbackContext, file_path: str, title: str) -> None:
-    try:
-        demo_path, demo_size = create_audio_demo(file_path, start_time=0, duration=30)
+    await download_queue.submit(context.bot, update.message, "audio_demo", {
+        "file": file_payload(file),
+        "title": title,
+        "start": None,
+        "duration": DEMO_DURATION,
+        "caption": None,
+        "cache_key": cache_key,
+        "replace_previous": False,
+    }, "در حال ایجاد فایل صوتی...")
 
-        first_message_after_creating = await update.message.reply_text("در حال آپلود فایل صوتی...")
+async def handle_audio_batch(updates, context: CallbackContext) -> None:
+    if len(updates) == 1:
+        await handle_audio_file(updates[0], context)
+    else:
+        await handle_audio_album(updates, context)
 
-        uploader = ProgressUploader(demo_path)
-        if demo_size <= MAX_VOICE_SIZE:
-            demo_message = await uploader.upload(
-                context.bot,
-                update.message.chat_id,
-                caption=f"{title}",
-                as_voice=True
-            )
-        else:
-            demo_message = await uploader.upload(
-                context.bot,
-                update.message.chat_id,
-                caption=f"{title} (فایل صوتی بزرگتر از 50 مگابایت است.)",
-                as_voice=False
+async def build_album_demo(bot, file, chat_id, semaphore, output_dir):
+    async with semaphore:
+        with source_cache.lease(file.file_unique_id):
+            source = await fetch_source_audio(bot, file, chat_id)
+            start_time = await pick_demo_start(source) if SMART_DEMO_START else 0
+            demo_path, _ = await transcode_service.run(
+                create_audio_demo, source["path"], start_time, DEMO_DURATION,
+                timeout=transcode_service.job_timeout, output_dir=output_dir, audio_format="m4a",
             )
+            return demo_path
 
-        await context.bot.delete_message(chat_id=update.message.chat_id, message_id=first_message_after_creating.message_id)
+async def handle_audio_album(updates, context: CallbackContext) -> None:
+    message = updates[0].message
+    user_id = message.from_user.id
+    remaining_time = audio_cooldown.claim(user_id)
+    if remaining_time:
+        await message.reply_text(f"لطفاً {remaining_time:.0f} ثانیه صبر کنید.")
+        return
 
-        last_demo_messages[update.effective_user.id] = demo_message.message_id
+    items = []
+    for update in updates:
+        file, title = get_audio_file(update.message)
+        if file is not None and (file.file_size or 0) <= MAX_FILE_SIZE:
+            items.append({"file": file_payload(file), "title": title})
+    if not items:
+        audio_cooldown.release(user_id)
+        await message.reply_text("این فایل‌ها بسیار بزرگ هستند. لطفاً فایل‌های کوچکتری ارسال کنید.")
+        return
+
+    await download_queue.submit(
+        context.bot, message, "audio_album", {"items": items}, f"در حال ایجاد {len(items)} فایل صوتی..."
+    )
+
+async def process_audio_album_job(bot, job) -> None:
+    chat_id = job["chat_id"]
+    payload = job["payload"]
+    status_message = StatusMessage(bot, chat_id, payload["status_message_id"], payload["status_text"])
+    items = [(Document(**item["file"]), item["title"]) for item in payload["items"]]
+    semaphore = asyncio.Semaphore(ALBUM_CONCURRENCY)
+    # Album demos go out as M4A InputMediaAudio, which cannot reuse a voice
+    # file_id, so they are cached under their own key.
+    keys = [
+        demo_cache_key(file.file_unique_id, "auto" if SMART_DEMO_START else 0, DEMO_DURATION) + ":m4a"
+        for file, _ in items
+    ]
+    cached = [demo_cache.get(key) for key in keys]
+    reserve = DEMO_SCRATCH_RESERVE * sum(hit is None for hit in cached)
+    async with scratch_space.job_dir(reserve) as job_path:
+        results = await asyncio.gather(
+            *(
+                build_album_demo(bot, file, chat_id, semaphore, job_path)
+                for (file, _), hit in zip(items, cached) if hit is None
+            ),
+            return_exceptions=True,
+        )
+
+        media, media_keys, media_sizes = [], [], []
+        results = iter(results)
+        for (file, title), key, hit in zip(items, keys, cached):
+            if hit is not None:
+                source = hit["file_id"]
+                media_sizes.append(0)
+            else:
+                result = next(results)
+                if isinstance(result, BaseException):
+                    logging.error(f"Error creating album demo for {title}: {result}")
+                    continue
+                media_sizes.append(os.path.getsize(result))
+                source = Path(result)
+            media.append(InputMediaAudio(media=source, caption=title, title=title, filename="demo.m4a"))
+            media_keys.append(key)
+
+        try:
+            if not media:
+                await status_message.edit_text("خطا در ایجاد فایل‌های صوتی.")
+                return
 
-        cooldown_users_audio[update.message.from_user.id] = time.time()
-
-    except Exception as e:
-        logging.error(f"Error creating audio demo: {e}")
-        await update.message.reply_text(f"خطا در ایجاد فایل صوتی: {e}")
-    finally:
-        if os.path.exists(demo_path):
-            os.remove(demo_path)
-
-class ProgressUploader:
-    def __init__(self, file_path):
-        self.file_path = file_path
-        self.file_size = os.path.getsize(file_path)
-        self.uploaded = 0
-        self.pbar = tqdm(total=self.file_size, unit='B', unit_scale=True, desc="Uploading")
-
-    async def upload(self, bot, chat_id, caption=None, as_voice=False):
-        with open(self.file_path, 'rb') as file:
-            input_file = InputFile(file)
-            try:
-                if as_voice:
-                    message = await bot.send_voice(
+            for index in range(0, len(media), MEDIA_GROUP_LIMIT):
+                chunk_size = sum(media_sizes[index:index + MEDIA_GROUP_LIMIT])
+                async with transfer_service.slot(chat_id, chunk_size):
+                    messages = await bot.send_media_group(
                         chat_id=chat_id,
-                        voice=input_file,
-                        caption=caption,
+                        media=media[index:index + MEDIA_GROUP_LIMIT],
                         read_timeout=300,
-                        write_timeout=300
+                        write_timeout=300,
                     )
-                else:
-                    message = await bot.send_document(
-                        chat_id=chat_id,
-                        document=input_file,
-                        caption=caption,
-                        read_timeout=300,
-                        write_timeout=300
+                for key, demo_message in zip(media_keys[index:index + MEDIA_GROUP_LIMIT], messages):
+                    remember_demo(key, demo_message)
+
+            last_demo_messages[job["user_id"]] = messages[-1].message_id
+            await status_message.delete()
+        except Exception as e:
+            # Not retried: part of the album may already have been delivered.
+            logging.error(f"Error sending album demos: {e}")
+            await status_message.edit_text(f"خطا در ارسال فایل‌های صوتی: {e}")
+
+async def delete_previous_demo(bot, chat_id, user_id) -> None:
+    if user_id in last_demo_messages:
+        try:
+            await bot.delete_message(chat_id=chat_id, message_id=last_demo_messages[user_id])
+        except Exception as e:
+            logging.error(f"Error deleting previous demo: {e}")
+
+async def send_demo(bot, chat_id, user_id, demo, demo_size: int, title: str, cache_key: str = None, status_message=None) -> None:
+    await status_message.edit_text("در حال آپلود فایل صوتی...")
+
+    if demo_size <= MAX_VOICE_SIZE:
+        demo_message = await transfer_service.upload(
+            bot,
+            chat_id,
+            demo,
+            caption=f"{title}",
+            as_voice=True,
+            filename="demo.ogg",
+            status_message=status_message
+        )
+    else:
+        demo_message = await transfer_service.upload(
+            bot,
+            chat_id,
+            demo,
+            caption=f"{title} (فایل صوتی بزرگتر از 50 مگابایت است.)",
+            as_voice=False,
+            filename="demo.ogg",
+            status_message=status_message
+        )
+
+    await status_message.delete()
+
+    last_demo_messages[user_id] = demo_message.message_id
+    if cache_key:
+        remember_demo(cache_key, demo_message)
+
+async def process_audio_demo_job(bot, job) -> None:
+    chat_id = job["chat_id"]
+    payload = job["payload"]
+    file = Document(**payload["file"])
+    status_message = StatusMessage(bot, chat_id, payload["status_message_id"], payload["status_text"])
+    start_time = payload["start"]
+    try:
+        async with scratch_space.job_dir(DEMO_SCRATCH_RESERVE) as job_path:
+            if start_time is None and can_stream_demo(file):
+                start_time = 0
+                demo = await stream_audio_demo(bot, file, start_time, payload["duration"], chat_id)
+                demo_size = len(demo)
+            else:
+                with source_cache.lease(file.file_unique_id):
+                    source = await fetch_source_audio(bot, file, chat_id)
+                    if start_time is None:
+                        start_time = await pick_demo_start(source) if SMART_DEMO_START else 0
+                    start_time = clamp_demo_start(start_time, payload["duration"], source["metadata"].get("duration"))
+                    demo, demo_size = await transcode_service.run(
+                        create_audio_demo, source["path"], start_time, payload["duration"],
+                        timeout=transcode_service.job_timeout, output_dir=job_path,
                     )
-                
-                chunk_size = 1024 * 1024
-                while self.uploaded < self.file_size:
-                    self.uploaded = min(self.uploaded + chunk_size, self.file_size)
-                    self.pbar.update(min(chunk_size, self.file_size - self.pbar.n))
-                    await asyncio.sleep(0.1)
-                
-                return message
-            finally:
-                self.pbar.close()
+
+            caption = payload["caption"] or (f"{payload['title']} (from {start_time}s)" if start_time else payload["title"])
+            if payload["replace_previous"]:
+                await delete_previous_demo(bot, chat_id, job["user_id"])
+            await send_demo(bot, chat_id, job["user_id"], demo, demo_size, caption, payload["cache_key"], status_message)
+    except TranscodeQueueFull:
+        await status_message.edit_text("سرور مشغول است. لطفاً چند دقیقه دیگر دوباره تلاش کنید.")
+
+async def audio_job_failed(bot, job, error) -> None:
+    text = f"خطا در ایجاد فایل صوتی: {error}"
+    await StatusMessage(bot, job["chat_id"], job["payload"]["status_message_id"], text).edit_text(text)
+
+download_queue.register("audio_demo", process_audio_demo_job, audio_job_failed)
+download_queue.register("audio_album", process_audio_album_job, audio_job_failed)
@@ -0,0 +1,109 @@
+import logging
+import threading
+from collections import deque
+
+# Total download rate the bot may use, in bytes per second; None disables
+# pacing altogether. Only yt-dlp jobs are paced: files fetched from and sent
+# to Telegram go through transfer_service, which bounds them by slot count
+# instead, so leave room for those here as well as for moderation.
+TOTAL_DOWNLOAD_RATE = 8 * 1024 * 1024
+# Kept free for Telegram API calls so moderation (deletes, mutes, replies)
+# stays responsive while downloads saturate the link.
+MODERATION_HEADROOM = 512 * 1024
+MIN_JOB_RATE = 256 * 1024
+# Share weight per priority point: an admin job (priority 10) gets twice
+# the bandwidth of a regular one.
+PRIORITY_WEIGHT_STEP = 0.1
+RECENT_JOBS = 50
+
+class BandwidthScheduler:
+    def __init__(self, total_rate, headroom, min_rate):
+        self.total_rate = total_rate
+        self.headroom = headroom
+        self.min_rate = min_rate
+        self.jobs = 0
+        self.downloaded = 0
+        self.download_seconds = 0.0
+        self.recent = deque(maxlen=RECENT_JOBS)
+        self._active = {}
+        self._next_token = 0
+        self._lock = threading.Lock()
+
+    def budget(self):
+        if not self.total_rate:
+            return None
+        return max(self.total_rate - self.headroom, self.min_rate)
+
+    def shares(self, priorities):
+        budget = self.budget()
+        if budget is None:
+            return {token: None for token in priorities}
+        weights = {token: 1 + priority * PRIORITY_WEIGHT_STEP for token, priority in priorities.items()}
+        total_weight = sum(weights.values())
+        return {
+            token: max(int(budget * weight / total_weight), self.min_rate)
+            for token, weight in weights.items()
+        }
+
+    def _rebalance(self):
+        shares = self.shares({token: job["priority"] for token, job in self._active.items()})
+        for token, rate in shares.items():
+            job = self._active[token]
+            if job["rate"] != rate:
+                job["rate"] = rate
+                job["shared"]["rate"] = rate
+
+    # add() and remove() talk to the manager process that holds each job's
+    # shared dict, so they block; call them off the event loop.
+    def add(self, shared, priority):
+        with self._lock:
+            token = self._next_token
+            self._next_token += 1
+            self._active[token] = {"shared": shared, "priority": priority, "rate": None}
+            self._rebalance()
+            return token
+
+    def remove(self, token, name, elapsed):
+        with self._lock:
+            job = self._active.pop(token)
+            self._rebalance()
+        try:
+            downloaded = job["shared"].get("downloaded", 0)
+        except (OSError, EOFError):
+            downloaded = 0
+        throughput = downloaded / elapsed if elapsed else 0.0
+        with self._lock:
+            self.jobs += 1
+            self.downloaded += downloaded
+            self.download_seconds += elapsed
+            self.recent.append({
+                "job": name,
+                "priority": job["priority"],
+                "bytes": downloaded,
+                "seconds": elapsed,
+                "throughput": throughput,
+                "rate_limit": job["rate"],
+            })
+        if downloaded:
+            limit = f"{job['rate'] / 1024 / 1024:.1f} MB/s" if job["rate"] else "none"
+            logging.info(
+                f"{name} downloaded {downloaded / 1024 / 1024:.1f} MB in {elapsed:.1f}s "
+                f"({throughput / 1024 / 1024:.2f} MB/s, limit {limit})"
+            )
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active_jobs": len(self._active),
+                "rates": [job["rate"] for job in self._active.values()],
+                "jobs": self.jobs,
+                "downloaded": self.downloaded,
+                "average_throughput": self.downloaded / self.download_seconds if self.download_seconds else 0.0,
+                "recent": list(self.recent),
+            }
+
+bandwidth_scheduler = BandwidthScheduler(
+    total_rate=TOTAL_DOWNLOAD_RATE,
+    headroom=MODERATION_HEADROOM,
+    min_rate=MIN_JOB_RATE,
+)
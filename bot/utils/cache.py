@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_PATH = 'cache/'
+# Changes within this many seconds share one write of the file.
+CACHE_SAVE_DELAY = 5.0
+
+class PersistentLRUCache:
+    def __init__(self, path, max_entries, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._version = 0
+        self._saved_version = 0
+        self._save_handle = None
+        self._save_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for key, value, *stored_at in json.load(f):
+                    self._entries[key] = (value, stored_at[0] if stored_at else time.time())
+        except (OSError, ValueError) as e:
+            logging.error(f"Error loading cache {self.path}: {e}")
+            self._entries.clear()
+        self._evict()
+
+    def _snapshot(self):
+        # Least recently used first, so a reload keeps the LRU order.
+        return [[key, value, stored_at] for key, (value, stored_at) in self._entries.items()]
+
+    def _write(self, rows, version):
+        # Writes may finish out of order on the thread pool; an older
+        # snapshot must not replace a newer file.
+        with self._save_lock:
+            if version <= self._saved_version:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = self.path + ".tmp"
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(rows, f, ensure_ascii=False)
+                os.replace(temp_path, self.path)
+                self._saved_version = version
+            except (OSError, TypeError, ValueError) as e:
+                logging.error(f"Error saving cache {self.path}: {e}")
+
+    def _changed(self):
+        self._version += 1
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        # Rewriting the whole file on every set or hit would block the event
+        # loop; changes are batched and written from a thread instead.
+        if self._save_handle is None:
+            self._save_handle = loop.call_later(CACHE_SAVE_DELAY, self._save_later, loop)
+
+    def _save_later(self, loop):
+        self._save_handle = None
+        loop.run_in_executor(None, self._write, self._snapshot(), self._version)
+
+    def flush(self):
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        self._write(self._snapshot(), self._version)
+
+    def _evict(self):
+        if self.ttl is not None:
+            expired_before = time.time() - self.ttl
+            for key in [key for key, (_, stored_at) in self._entries.items() if stored_at < expired_before]:
+                del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _expired(self, key):
+        return self.ttl is not None and time.time() - self._entries[key][1] > self.ttl
+
+    def get(self, key):
+        if key in self._entries and self._expired(key):
+            self.delete(key)
+        if key not in self._entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if next(reversed(self._entries)) != key:
+            self._entries.move_to_end(key)
+            self._changed()
+        return self._entries[key][0]
+
+    def set(self, key, value):
+        self._entries[key] = (value, time.time())
+        self._entries.move_to_end(key)
+        self._evict()
+        self._changed()
+
+    def delete(self, key):
+        if self._entries.pop(key, None) is not None:
+            self._changed()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def __len__(self):
+        return len(self._entries)
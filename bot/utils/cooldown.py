@@ -14,4 +14,19 @@ class CooldownManager:
         self.user_last_download_time[user_id] = current_time
         return False
 
+    def claim(self, user_id):
+        # Checks and stamps in one synchronous step: with concurrent updates,
+        # a check followed by a later set lets rapid repeats all slip through.
+        # Returns the seconds left to wait, or 0 once the slot is taken.
+        current_time = time.time()
+        last_time = self.user_last_download_time.get(user_id)
+        if last_time is not None and current_time - last_time < self.cooldown_time:
+            return self.cooldown_time - (current_time - last_time)
+        self.user_last_download_time[user_id] = current_time
+        return 0
+
+    def release(self, user_id):
+        # For requests that turned out to do nothing.
+        self.user_last_download_time.pop(user_id, None)
+
 cooldown_manager = CooldownManager(cooldown_time=60)
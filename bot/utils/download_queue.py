@@ -0,0 +1,315 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import OrderedDict, deque
+
+from telegram.error import TelegramError
+
+from bot.utils.cache import CACHE_PATH
+from bot.utils.permissions import is_chat_admin, is_bot_owner
+from bot.utils.status_message import status_editor, StatusMessage
+
+DOWNLOAD_QUEUE_PATH = os.path.join(CACHE_PATH, 'download_queue.sqlite3')
+DOWNLOAD_QUEUE_WORKERS = 4
+MAX_JOB_ATTEMPTS = 3
+RETRY_DELAY = 30
+FINISHED_JOB_RETENTION = 24 * 60 * 60
+
+DEFAULT_PRIORITY = 0
+ADMIN_PRIORITY = 10
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+def queued_text(position):
+    return f"در صف انتظار هستید. نوبت شما: {position}"
+
+class DownloadQueue:
+    def __init__(self, path, worker_slots, max_attempts):
+        self.path = path
+        self.worker_slots = worker_slots
+        self.max_attempts = max_attempts
+        self._handlers = {}
+        self._db = None
+        self._wakeup = None
+        self._workers = []
+        self._running = 0
+        # Round-robin bookkeeping: the turn at which each chat, and each user
+        # inside a chat, was last served. Whoever waited longest goes next.
+        self._turn = 0
+        self._chat_turns = {}
+        self._user_turns = {}
+        self._reported_positions = {}
+
+    def register(self, kind, handler, on_failure=None):
+        self._handlers[kind] = (handler, on_failure)
+
+    def _connect(self):
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.path, isolation_level=None)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    chat_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    announced INTEGER NOT NULL DEFAULT 0,
+                    not_before REAL NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    last_error TEXT
+                )"""
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+        return self._db
+
+    def _job(self, row):
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def _set_status(self, job_id, status, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        self._connect().execute(
+            f"UPDATE jobs SET status = ?, updated_at = ?{', ' + columns if columns else ''} WHERE id = ?",
+            (status, time.time(), *fields.values(), job_id),
+        )
+
+    def enqueue(self, kind, chat_id, user_id, payload, priority=DEFAULT_PRIORITY):
+        now = time.time()
+        cursor = self._connect().execute(
+            "INSERT INTO jobs (kind, chat_id, user_id, priority, payload, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (kind, chat_id, user_id, priority, json.dumps(payload, ensure_ascii=False), PENDING, now, now),
+        )
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return cursor.lastrowid
+
+    def save_payload(self, job):
+        # Lets a handler checkpoint its progress so a retry or a restart
+        # can skip the parts that are already done.
+        self._connect().execute(
+            "UPDATE jobs SET payload = ?, updated_at = ? WHERE id = ?",
+            (json.dumps(job["payload"], ensure_ascii=False), time.time(), job["id"]),
+        )
+
+    def _schedule(self, now=None):
+        # Returns the pending jobs in the order workers will take them:
+        # highest priority first, then round-robin over chats and, within a
+        # chat, over users; each user's own jobs stay first-in first-out.
+        now = time.time() if now is None else now
+        rows = self._connect().execute(
+            "SELECT * FROM jobs WHERE status = ? AND not_before <= ? ORDER BY id", (PENDING, now)
+        ).fetchall()
+        chat_turns = dict(self._chat_turns)
+        user_turns = dict(self._user_turns)
+        turn = self._turn
+        order = []
+        for priority in sorted({row["priority"] for row in rows}, reverse=True):
+            chats = OrderedDict()
+            for row in rows:
+                if row["priority"] == priority:
+                    chats.setdefault(row["chat_id"], OrderedDict()).setdefault(row["user_id"], deque()).append(row)
+            while chats:
+                chat_id = min(chats, key=lambda chat: chat_turns.get(chat, -1))
+                users = chats[chat_id]
+                user_id = min(users, key=lambda user: user_turns.get((chat_id, user), -1))
+                order.append(users[user_id].popleft())
+                turn += 1
+                chat_turns[chat_id] = turn
+                user_turns[(chat_id, user_id)] = turn
+                if not users[user_id]:
+                    del users[user_id]
+                if not users:
+                    del chats[chat_id]
+        return order
+
+    def position(self, job_id):
+        for index, row in enumerate(self._schedule()):
+            if row["id"] == job_id:
+                return index + 1
+        return 0
+
+    def idle_slots(self):
+        return self.worker_slots - self._running
+
+    def _claim_next(self):
+        order = self._schedule()
+        if not order:
+            return None
+        row = order[0]
+        self._turn += 1
+        self._chat_turns[row["chat_id"]] = self._turn
+        self._user_turns[(row["chat_id"], row["user_id"])] = self._turn
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+            (RUNNING, time.time(), row["id"]),
+        )
+        job = self._job(row)
+        job["attempts"] += 1
+        return job
+
+    def _next_retry_delay(self):
+        row = self._connect().execute(
+            "SELECT MIN(not_before) FROM jobs WHERE status = ?", (PENDING,)
+        ).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    async def submit(self, bot, message, kind, payload, status_text, user_id=None):
+        # Replies with a status message the job keeps editing, then queues
+        # the job; if every worker slot is busy the reply shows the position.
+        # user_id overrides the message author, e.g. for button presses.
+        chat_id = message.chat_id
+        user_id = user_id or message.from_user.id
+        priority = DEFAULT_PRIORITY
+        if is_bot_owner(user_id) or await is_chat_admin(bot, chat_id, user_id):
+            priority = ADMIN_PRIORITY
+
+        status_message = await message.reply_text(status_text)
+        job_id = self.enqueue(kind, chat_id, user_id, {
+            **payload,
+            "reply_to": message.message_id,
+            "status_message_id": status_message.message_id,
+            "status_text": status_text,
+        }, priority)
+
+        position = self.position(job_id)
+        if position > self.idle_slots():
+            self._connect().execute("UPDATE jobs SET announced = 1 WHERE id = ?", (job_id,))
+            self._reported_positions[job_id] = position
+            await status_message.edit_text(queued_text(position))
+        return job_id
+
+    def _report_positions(self, bot):
+        for index, row in enumerate(self._schedule()):
+            position = index + 1
+            if row["announced"] and self._reported_positions.get(row["id"]) != position:
+                self._reported_positions[row["id"]] = position
+                payload = json.loads(row["payload"])
+                status_editor.update(bot, row["chat_id"], payload["status_message_id"], queued_text(position))
+
+    async def _run(self, bot, job):
+        handler, on_failure = self._handlers[job["kind"]]
+        payload = job["payload"]
+        if job["announced"] or job["attempts"] > 1:
+            status = StatusMessage(bot, job["chat_id"], payload["status_message_id"], payload["status_text"])
+            try:
+                await status.edit_text(payload["status_text"])
+            except TelegramError as e:
+                logging.error(f"Error updating status of job {job['id']}: {e}")
+
+        try:
+            await handler(bot, job)
+        except asyncio.CancelledError:
+            # Left as running on purpose: the next start() picks it up again.
+            raise
+        except Exception as e:
+            logging.error(f"Job {job['id']} ({job['kind']}) failed on attempt {job['attempts']}: {e}")
+            if job["attempts"] < self.max_attempts:
+                self._set_status(
+                    job["id"], PENDING, last_error=str(e), not_before=time.time() + RETRY_DELAY * job["attempts"]
+                )
+                return
+            self._set_status(job["id"], FAILED, last_error=str(e))
+            if on_failure is not None:
+                try:
+                    await on_failure(bot, job, e)
+                except Exception as notify_error:
+                    logging.error(f"Error reporting failed job {job['id']}: {notify_error}")
+        else:
+            self._set_status(job["id"], DONE)
+
+    async def _worker(self, bot):
+        while True:
+            # Nothing restarts a worker that dies, so one bad job or a locked
+            # database must only cost that iteration.
+            try:
+                await self._work_once(bot)
+            except Exception as e:
+                logging.error(f"Download queue worker error: {e}")
+                await asyncio.sleep(1)
+
+    async def _work_once(self, bot):
+        job = self._claim_next()
+        if job is None:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._next_retry_delay())
+            except asyncio.TimeoutError:
+                pass
+            return
+
+        self._reported_positions.pop(job["id"], None)
+        try:
+            self._report_positions(bot)
+        except Exception as e:
+            # Only the queue positions go stale; the claimed job still runs.
+            logging.error(f"Error reporting queue positions: {e}")
+        if job["kind"] not in self._handlers:
+            logging.error(f"Job {job['id']} has unknown kind {job['kind']}")
+            self._set_status(job["id"], FAILED, last_error="unknown kind")
+            return
+
+        self._running += 1
+        try:
+            await self._run(bot, job)
+        finally:
+            self._running -= 1
+            self._wakeup.set()
+
+    async def start(self, bot):
+        db = self._connect()
+        # Jobs that were running when the bot went down start over.
+        resumed = db.execute(
+            "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?", (PENDING, time.time(), RUNNING)
+        ).rowcount
+        db.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+            (DONE, FAILED, time.time() - FINISHED_JOB_RETENTION),
+        )
+        if resumed:
+            logging.info(f"Resuming {resumed} interrupted download jobs")
+
+        self._wakeup = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._worker(bot)) for _ in range(self.worker_slots)
+        ]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def metrics(self):
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {
+            "running_slots": self._running,
+            **{status: count for status, count in rows},
+        }
+
+download_queue = DownloadQueue(
+    DOWNLOAD_QUEUE_PATH,
+    worker_slots=DOWNLOAD_QUEUE_WORKERS,
+    max_attempts=MAX_JOB_ATTEMPTS,
+)
@@ -0,0 +1,33 @@
+import re
+
+MAX_LINKS_PER_MESSAGE = 5
+
+# watch?v=, youtu.be/, shorts/, embed/, live/ and v/ links on the www, m.,
+# music. and nocookie hosts. Hosts are matched case-insensitively; the
+# 11-character video id is case-sensitive.
+YOUTUBE_LINK_REGEX = re.compile(
+    r"(?i:(?:https?://)?(?:www\.|m\.|music\.)?"
+    r"(?:youtube(?:-nocookie)?\.com/(?:watch\?(?:[^\s#]*?&)?v=|shorts/|embed/|live/|v/)|youtu\.be/))"
+    r"([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])"
+)
+
+VIDEO_ID_REGEX = re.compile(r"[A-Za-z0-9_-]{11}")
+
+def is_video_id(video_id):
+    return VIDEO_ID_REGEX.fullmatch(video_id) is not None
+
+def extract_video_ids(text, limit=MAX_LINKS_PER_MESSAGE):
+    # Runs on every group message: a plain substring test rejects almost all
+    # of them before the regex is touched.
+    if not text or "youtu" not in text.lower():
+        return []
+    video_ids = dict.fromkeys(match.group(1) for match in YOUTUBE_LINK_REGEX.finditer(text))
+    return list(video_ids)[:limit]
+
+def has_youtube_link(text):
+    if not text or "youtu" not in text.lower():
+        return False
+    return YOUTUBE_LINK_REGEX.search(text) is not None
+
+def canonical_video_url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
@@ -0,0 +1,97 @@
+import logging
+from array import array
+
+from telegram.error import TelegramError
+
+# Recent messages remembered per chat; enough to clean up after a raid.
+MESSAGE_INDEX_SIZE = 2000
+# Bot API limit for one deleteMessages call.
+DELETE_BATCH_SIZE = 100
+
+class MessageRing:
+    # Two parallel int64 arrays instead of a tuple per message: 16 bytes
+    # per slot, and a full ring never allocates again.
+    __slots__ = ("size", "message_ids", "user_ids", "next", "count")
+
+    def __init__(self, size):
+        self.size = size
+        self.message_ids = array('q', bytes(8 * size))
+        self.user_ids = array('q', bytes(8 * size))
+        self.next = 0
+        self.count = 0
+
+    def add(self, message_id, user_id):
+        self.message_ids[self.next] = message_id
+        self.user_ids[self.next] = user_id
+        self.next = (self.next + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+    def newest_first(self):
+        for offset in range(1, self.count + 1):
+            slot = (self.next - offset) % self.size
+            # Deleted messages are zeroed rather than compacted away.
+            if self.message_ids[slot]:
+                yield slot
+
+    def forget(self, message_ids):
+        for slot in list(self.newest_first()):
+            if self.message_ids[slot] in message_ids:
+                self.message_ids[slot] = 0
+
+class MessageIndex:
+    def __init__(self, size):
+        self.size = size
+        self._chats = {}
+
+    def record(self, chat_id, message_id, user_id):
+        ring = self._chats.get(chat_id)
+        if ring is None:
+            ring = self._chats[chat_id] = MessageRing(self.size)
+        ring.add(message_id, user_id)
+
+    def last(self, chat_id, count, before=None):
+        ring = self._chats.get(chat_id)
+        if ring is None:
+            return []
+        message_ids = []
+        for slot in ring.newest_first():
+            if len(message_ids) >= count:
+                break
+            message_id = ring.message_ids[slot]
+            if before is None or message_id < before:
+                message_ids.append(message_id)
+        return message_ids
+
+    def from_user(self, chat_id, user_id):
+        ring = self._chats.get(chat_id)
+        if ring is None:
+            return []
+        return [ring.message_ids[slot] for slot in ring.newest_first() if ring.user_ids[slot] == user_id]
+
+    def forget(self, chat_id, message_ids):
+        ring = self._chats.get(chat_id)
+        if ring is not None:
+            ring.forget(set(message_ids))
+
+    def stats(self):
+        return {
+            "chats": len(self._chats),
+            "messages": sum(ring.count for ring in self._chats.values()),
+        }
+
+message_index = MessageIndex(MESSAGE_INDEX_SIZE)
+
+async def delete_messages_batched(bot, chat_id, message_ids):
+    # One deleteMessages request per 100 ids instead of one request per
+    # message; Telegram skips ids that are already gone.
+    message_ids = list(dict.fromkeys(message_ids))
+    deleted = 0
+    for start in range(0, len(message_ids), DELETE_BATCH_SIZE):
+        batch = message_ids[start:start + DELETE_BATCH_SIZE]
+        try:
+            await bot.delete_messages(chat_id, batch)
+            deleted += len(batch)
+        except TelegramError as e:
+            logging.error(f"Error deleting {len(batch)} messages in {chat_id}: {e}")
+    message_index.forget(chat_id, message_ids)
+    return deleted
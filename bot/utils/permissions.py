@@ -0,0 +1,9 @@
+from bot.utils.admin_roster import admin_roster
+
+async def is_chat_admin(bot, chat_id: int, user_id: int) -> bool:
+    return await admin_roster.is_admin(bot, chat_id, user_id)
+
+def is_bot_owner(user_id: int) -> bool:
+    # Imported here so the queue and the roster load without bot secrets.
+    from misc import ADMIN_ID
+    return str(user_id) == str(ADMIN_ID)
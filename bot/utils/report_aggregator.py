@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+from telegram.error import BadRequest
+
+from bot.utils.admin_roster import admin_roster
+
+# Reports about the same user join one notification until this long after
+# the first of them.
+REPORT_WINDOW = 10 * 60
+
+NEW = 'new'
+ADDED = 'added'
+DUPLICATE = 'duplicate'
+
+class ReportNotSent(Exception):
+    pass
+
+def report_text(mentions, reported_user, reporters, messages):
+    text = (
+        f"{mentions}\n"
+        f"کاربر "
+        f"[{reported_user.full_name}](tg://user?id={reported_user.id}) گزارش شد."
+    )
+    if reporters > 1:
+        text += f"\nتعداد گزارش‌ها: {reporters}"
+    if messages > 1:
+        text += f"\nتعداد پیام‌های گزارش‌شده: {messages}"
+    return text
+
+class ReportAggregator:
+    def __init__(self, window):
+        self.window = window
+        self.reports = 0
+        self.notifications = 0
+        self._open = {}
+
+    def _expire(self, now):
+        for key in [key for key, entry in self._open.items() if entry["expires"] <= now]:
+            del self._open[key]
+
+    def _text(self, reported_user, entry):
+        return report_text(
+            entry["mentions"],
+            reported_user,
+            len({reporter_id for reporter_id, _ in entry["reports"]}),
+            len({message_id for _, message_id in entry["reports"]}),
+        )
+
+    async def _notify(self, bot, chat_id, reported_user, entry, reply_to):
+        message = await bot.send_message(
+            chat_id=chat_id,
+            text=self._text(reported_user, entry),
+            parse_mode="Markdown",
+            reply_to_message_id=reply_to,
+            allow_sending_without_reply=True,
+        )
+        entry["message_id"] = message.message_id
+        self.notifications += 1
+
+    async def _refresh(self, bot, chat_id, reported_user, entry, reply_to):
+        # Edits do not ping anyone again; they only keep the counts live. If
+        # the admins deleted the notification, later reports would edit
+        # nothing, so they get a new one instead.
+        try:
+            await bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=entry["message_id"],
+                text=self._text(reported_user, entry),
+                parse_mode="Markdown",
+            )
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                return
+            await self._notify(bot, chat_id, reported_user, entry, reply_to)
+
+    async def report(self, bot, chat_id, reported_user, reporter_id, message_id):
+        # The first report pings the admins with a new message, as a reply to
+        # the reported message; later ones within the window only edit its
+        # counts, so ten reports of one spammer cost one notification. A
+        # message always has one author, so keying by user also gathers every
+        # report of the same message.
+        now = time.monotonic()
+        self._expire(now)
+        self.reports += 1
+        key = (chat_id, reported_user.id)
+        entry = self._open.get(key)
+        if entry is not None:
+            if (reporter_id, message_id) in entry["reports"]:
+                return DUPLICATE
+            entry["reports"].add((reporter_id, message_id))
+            # While the first report's notification is still being sent,
+            # wait for it: if it fails, this report has failed too and the
+            # caller says so instead of claiming it was added.
+            await asyncio.shield(entry["sent"])
+            try:
+                async with entry["lock"]:
+                    await self._refresh(bot, chat_id, reported_user, entry, message_id)
+            except BaseException:
+                if self._open.get(key) is entry:
+                    del self._open[key]
+                raise
+            return ADDED
+
+        sent = asyncio.get_running_loop().create_future()
+        sent.add_done_callback(lambda f: f.cancelled() or f.exception())
+        # The window runs from the first report, so it closes even while
+        # reports keep coming in.
+        entry = {
+            "message_id": None,
+            "mentions": "",
+            "reports": {(reporter_id, message_id)},
+            "expires": now + self.window,
+            "sent": sent,
+            "lock": asyncio.Lock(),
+        }
+        self._open[key] = entry
+        try:
+            admins = await admin_roster.admins(bot, chat_id)
+            entry["mentions"] = "".join(
+                f"[ ](tg://user?id={admin.user.id})"
+                for admin in admins.values()
+                if not admin.user.is_bot
+            )
+            await self._notify(bot, chat_id, reported_user, entry, message_id)
+        except BaseException as e:
+            if self._open.get(key) is entry:
+                del self._open[key]
+            if isinstance(e, asyncio.CancelledError):
+                e = ReportNotSent("report notification was cancelled")
+            sent.set_exception(e)
+            raise
+        sent.set_result(entry["message_id"])
+        return NEW
+
+    def stats(self):
+        return {
+            "open": len(self._open),
+            "reports": self.reports,
+            "notifications": self.notifications,
+        }
+
+report_aggregator = ReportAggregator(window=REPORT_WINDOW)
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import asynccontextmanager
+
+SCRATCH_TMPFS_PATH = '/dev/shm/typology-bot'
+SCRATCH_DISK_PATH = 'downloads/'
+SCRATCH_QUOTA = 1024 * 1024 * 1024
+# tmpfs is RAM: only use it when it could hold the whole quota twice over.
+TMPFS_HEADROOM = 2
+SCRATCH_ADMISSION_TIMEOUT = 60
+SCRATCH_JANITOR_INTERVAL = 10 * 60
+SCRATCH_MAX_AGE = 60 * 60
+
+class ScratchQuotaExceeded(Exception):
+    pass
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+class ScratchManager:
+    def __init__(self, tmpfs_path, disk_path, quota, max_age):
+        self.tmpfs_path = tmpfs_path
+        self.disk_path = disk_path
+        self.quota = quota
+        self.max_age = max_age
+        self.root = None
+        self.reserved = 0
+        self.reclaimed = 0
+        self._active = {}
+        self._released = None
+        self._janitor = None
+
+    def _choose_root(self):
+        parent = os.path.dirname(self.tmpfs_path)
+        try:
+            if os.path.isdir(parent) and shutil.disk_usage(parent).free >= self.quota * TMPFS_HEADROOM:
+                os.makedirs(self.tmpfs_path, exist_ok=True)
+                return self.tmpfs_path
+        except OSError as e:
+            logging.warning(f"tmpfs scratch unavailable, using {self.disk_path}: {e}")
+        os.makedirs(self.disk_path, exist_ok=True)
+        return self.disk_path
+
+    def _get_root(self):
+        if self.root is None:
+            self.root = self._choose_root()
+            logging.info(f"Scratch space at {self.root}")
+        return self.root
+
+    @asynccontextmanager
+    async def job_dir(self, size_hint=0):
+        # Each job gets a private directory that is removed, with whatever
+        # the job left in it, when the job ends or fails.
+        if size_hint > self.quota:
+            raise ScratchQuotaExceeded(f"job needs {size_hint} bytes, quota is {self.quota}")
+        if self._released is None:
+            self._released = asyncio.Condition()
+
+        async with self._released:
+            try:
+                await asyncio.wait_for(
+                    self._released.wait_for(lambda: self.reserved + size_hint <= self.quota),
+                    SCRATCH_ADMISSION_TIMEOUT,
+                )
+            except asyncio.TimeoutError:
+                raise ScratchQuotaExceeded(
+                    f"{self.reserved} of {self.quota} scratch bytes reserved, cannot fit {size_hint} more"
+                ) from None
+            self.reserved += size_hint
+
+        try:
+            path = os.path.abspath(tempfile.mkdtemp(prefix="job-", dir=self._get_root()))
+        except OSError:
+            await self._release(size_hint)
+            raise
+        self._active[path] = size_hint
+        try:
+            yield path
+        finally:
+            reserved = self._active.pop(path)
+            await asyncio.to_thread(shutil.rmtree, path, True)
+            await self._release(reserved)
+
+    async def shrink(self, path, size):
+        # Lets a job that reserved for its worst case hand back what it
+        # turned out not to need.
+        reserved = self._active.get(path)
+        if reserved is None or size >= reserved:
+            return
+        self._active[path] = size
+        await self._release(reserved - size)
+
+    async def _release(self, size_hint):
+        async with self._released:
+            self.reserved -= size_hint
+            self._released.notify_all()
+
+    def sweep(self, everything=False):
+        # Reclaims what crashed or killed jobs left behind: directories no
+        # live job owns and, in the disk directory, loose files from before
+        # per-job directories existed.
+        now = time.time()
+        reclaimed = 0
+        for root in (self.tmpfs_path, self.disk_path):
+            if not os.path.isdir(root):
+                continue
+            for name in os.listdir(root):
+                path = os.path.join(root, name)
+                if os.path.abspath(path) in self._active:
+                    continue
+                try:
+                    if not everything and now - os.path.getmtime(path) < self.max_age:
+                        continue
+                    size = directory_size(path) if os.path.isdir(path) else os.path.getsize(path)
+                    if os.path.isdir(path):
+                        shutil.rmtree(path)
+                    else:
+                        os.remove(path)
+                    reclaimed += size
+                except OSError as e:
+                    logging.error(f"Error reclaiming scratch {path}: {e}")
+        if reclaimed:
+            logging.info(f"Scratch janitor reclaimed {reclaimed / 1024 / 1024:.1f} MB")
+        self.reclaimed += reclaimed
+        return reclaimed
+
+    async def _run_janitor(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.to_thread(self.sweep)
+
+    async def start(self, interval=SCRATCH_JANITOR_INTERVAL):
+        # Nothing is running yet, so anything already on disk is an orphan.
+        await asyncio.to_thread(self.sweep, True)
+        self._janitor = asyncio.create_task(self._run_janitor(interval))
+
+    async def stop(self):
+        if self._janitor is not None:
+            self._janitor.cancel()
+            await asyncio.gather(self._janitor, return_exceptions=True)
+            self._janitor = None
+
+    def stats(self):
+        return {
+            "root": self.root,
+            "active_jobs": len(self._active),
+            "reserved": self.reserved,
+            "quota": self.quota,
+            "reclaimed": self.reclaimed,
+        }
+
+scratch_space = ScratchManager(
+    tmpfs_path=SCRATCH_TMPFS_PATH,
+    disk_path=SCRATCH_DISK_PATH,
+    quota=SCRATCH_QUOTA,
+    max_age=SCRATCH_MAX_AGE,
+)
@@ -0,0 +1,35 @@
+import asyncio
+
+class FlightCancelled(Exception):
+    pass
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}
+
+    async def do(self, key, func):
+        # Returns (result, shared): shared is True for callers that were
+        # attached to a job another caller had already started.
+        future = self._calls.get(key)
+        if future is not None:
+            return await asyncio.shield(future), True
+
+        future = asyncio.get_running_loop().create_future()
+        # Keep asyncio from logging an exception nobody else was waiting for.
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._calls[key] = future
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            # Followers were not cancelled themselves; give them an ordinary
+            # error so their own except blocks clean up status messages.
+            future.set_exception(FlightCancelled(f"shared job {key!r} was cancelled"))
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._calls[key]
@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+import shutil
+import subprocess
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from bot.utils.cache import CACHE_PATH
+
+SOURCE_CACHE_PATH = os.path.join(CACHE_PATH, 'sources')
+SOURCE_CACHE_MAX_BYTES = 500 * 1024 * 1024
+SOURCE_CACHE_TTL = 15 * 60
+
+FFPROBE_BINARY = 'ffprobe'
+
+def probe_audio(file_path, timeout=30):
+    command = [
+        FFPROBE_BINARY, "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "json",
+        file_path,
+    ]
+    result = subprocess.run(command, check=True, capture_output=True, timeout=timeout)
+    probe = json.loads(result.stdout or b"{}")
+    duration = probe.get("format", {}).get("duration")
+    return {"duration": float(duration) if duration else None}
+
+class SourceCache:
+    def __init__(self, directory, max_bytes, ttl):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._leases = {}
+        self._prepared = False
+
+    def _prepare(self):
+        # The index lives in memory only, so anything left on disk by a
+        # previous run is unreachable and can go. Done lazily so worker
+        # processes that merely import this module never touch the disk.
+        if self._prepared:
+            return
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+        self._prepared = True
+
+    def path_for(self, key, extension):
+        self._prepare()
+        return os.path.join(self.directory, f"{key}{extension}")
+
+    def get(self, key):
+        self._prepare()
+        self._evict()
+        entry = self._entries.get(key)
+        if entry is None or not os.path.exists(entry["path"]):
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        entry["last_used"] = time.time()
+        return entry
+
+    def add(self, key, path, metadata=None):
+        if key in self._entries:
+            self._remove(key, keep_file=self._entries[key]["path"] == path)
+        size = os.path.getsize(path)
+        now = time.time()
+        entry = {"path": path, "size": size, "added": now, "last_used": now, "metadata": metadata or {}}
+        self._entries[key] = entry
+        self.total_bytes += size
+        self._evict()
+        return entry
+
+    @contextmanager
+    def lease(self, key):
+        self._leases[key] = self._leases.get(key, 0) + 1
+        try:
+            yield self._entries.get(key)
+        finally:
+            self._leases[key] -= 1
+            if not self._leases[key]:
+                del self._leases[key]
+
+    def _remove(self, key, keep_file=False):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry["size"]
+        if not keep_file and os.path.exists(entry["path"]):
+            try:
+                os.remove(entry["path"])
+            except OSError as e:
+                logging.error(f"Error removing cached source {entry['path']}: {e}")
+
+    def _evict(self):
+        now = time.time()
+        for key, entry in list(self._entries.items()):
+            if key not in self._leases and now - entry["last_used"] > self.ttl:
+                self._remove(key)
+
+        for key in list(self._entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            if key not in self._leases:
+                self._remove(key)
+
+    def __contains__(self, key):
+        entry = self._entries.get(key)
+        return entry is not None and os.path.exists(entry["path"])
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+source_cache = SourceCache(SOURCE_CACHE_PATH, SOURCE_CACHE_MAX_BYTES, SOURCE_CACHE_TTL)
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+# Telegram allows roughly 20 messages per minute in a group, edits included.
+STATUS_EDIT_INTERVAL = 3.0
+
+class ThrottledStatusEditor:
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._last_edit = {}
+        self._pending = {}
+        self._tasks = {}
+
+    def update(self, bot, chat_id, message_id, text, parse_mode=None):
+        # Only the newest text per message is kept; older ones are coalesced
+        # away, and a chat never gets more than one edit per interval.
+        pending = self._pending.setdefault(chat_id, OrderedDict())
+        pending[message_id] = (text, parse_mode)
+        if chat_id not in self._tasks:
+            self._tasks[chat_id] = asyncio.get_running_loop().create_task(self._flush(bot, chat_id))
+
+    def discard(self, chat_id, message_id):
+        pending = self._pending.get(chat_id)
+        if pending:
+            pending.pop(message_id, None)
+
+    async def _flush(self, bot, chat_id):
+        try:
+            while self._pending.get(chat_id):
+                wait = self._last_edit.get(chat_id, 0) + self.min_interval - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+
+                message_id, (text, parse_mode) = self._pending[chat_id].popitem(last=False)
+                try:
+                    await bot.edit_message_text(
+                        chat_id=chat_id, message_id=message_id, text=text, parse_mode=parse_mode
+                    )
+                except RetryAfter as e:
+                    self._pending[chat_id].setdefault(message_id, (text, parse_mode))
+                    self._pending[chat_id].move_to_end(message_id, last=False)
+                    retry_after = e.retry_after
+                    if hasattr(retry_after, "total_seconds"):
+                        retry_after = retry_after.total_seconds()
+                    await asyncio.sleep(retry_after)
+                except BadRequest:
+                    # "message is not modified" or the message is already gone
+                    pass
+                except TelegramError as e:
+                    logging.error(f"Error editing status message: {e}")
+                self._last_edit[chat_id] = time.monotonic()
+        finally:
+            del self._tasks[chat_id]
+            if not self._pending.get(chat_id):
+                self._pending.pop(chat_id, None)
+
+status_editor = ThrottledStatusEditor(STATUS_EDIT_INTERVAL)
+
+class StatusMessage:
+    # Stands in for a telegram Message when a queued job only has the ids of
+    # the status reply it was given, e.g. after a restart.
+    def __init__(self, bot, chat_id, message_id, text):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+
+    async def edit_text(self, text):
+        self.text = text
+        status_editor.discard(self.chat_id, self.message_id)
+        try:
+            await self.bot.edit_message_text(chat_id=self.chat_id, message_id=self.message_id, text=text)
+        except BadRequest:
+            pass
+
+    async def delete(self):
+        status_editor.discard(self.chat_id, self.message_id)
+        try:
+            await self.bot.delete_message(chat_id=self.chat_id, message_id=self.message_id)
+        except BadRequest:
+            pass
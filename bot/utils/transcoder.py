@@ -0,0 +1,79 @@
+import asyncio
+import functools
+import logging
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+TRANSCODE_WORKERS = 2
+TRANSCODE_MAX_QUEUE = 8
+TRANSCODE_JOB_TIMEOUT = 120
+TRANSCODE_TIMEOUT_GRACE = 10
+
+class TranscodeQueueFull(Exception):
+    pass
+
+class TranscodeService:
+    def __init__(self, max_workers, max_queue, job_timeout):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self._executors = set()
+        self._slots = None
+        self._waiting = 0
+
+    def _kill(self, executor):
+        for process in list(getattr(executor, '_processes', {}).values()):
+            process.terminate()
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+
+        if self._slots.locked() and self._waiting >= self.max_queue:
+            raise TranscodeQueueFull(f"{self._waiting} transcode jobs already waiting")
+
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    async def run(self, func, *args, **kwargs):
+        async with self.slot():
+            loop = asyncio.get_running_loop()
+            # Each job gets a worker process of its own: killing a worker of
+            # a shared pool breaks the pool and every other chat's job in it.
+            executor = ProcessPoolExecutor(max_workers=1)
+            self._executors.add(executor)
+            job = functools.partial(func, *args, **kwargs)
+            try:
+                future = loop.run_in_executor(executor, job)
+                return await asyncio.wait_for(future, self.job_timeout + TRANSCODE_TIMEOUT_GRACE)
+            except asyncio.TimeoutError:
+                logging.error(f"Transcode job {func.__name__} timed out, killing its worker")
+                self._kill(executor)
+                raise
+            except asyncio.CancelledError:
+                self._kill(executor)
+                raise
+            finally:
+                self._executors.discard(executor)
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        for executor in list(self._executors):
+            self._kill(executor)
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors.clear()
+
+transcode_service = TranscodeService(
+    max_workers=TRANSCODE_WORKERS,
+    max_queue=TRANSCODE_MAX_QUEUE,
+    job_timeout=TRANSCODE_JOB_TIMEOUT,
+)
@@ -0,0 +1,277 @@
+import asyncio
+import io
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from telegram import InputFile
+from tqdm import tqdm
+
+from bot.utils.status_message import status_editor
+
+UPLOAD_TIMEOUT = 300
+PROGRESS_STEP = 5
+
+TRANSFER_GLOBAL_LIMIT = 4
+TRANSFER_PER_CHAT_LIMIT = 2
+LARGE_FILE_THRESHOLD = 10 * 1024 * 1024
+LARGE_TRANSFER_LIMIT = 1
+
+def sanitize_filename(filename):
+    return "".join(c for c in filename if c.isalnum() or c in (' ', '.', '_')).rstrip()
+
+class CountingReader:
+    def __init__(self, file, callback):
+        self._file = file
+        self._callback = callback
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        self.bytes_read = self._file.tell()
+        self._callback(self.bytes_read)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+class ProgressUploader:
+    def __init__(self, source, filename=None, status_message=None):
+        # source is either a path on disk or the encoded bytes themselves
+        self.source = source
+        self.filename = filename
+        self.file_size = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+        self.status_message = status_message
+        self.uploaded = 0
+        self._reported_percent = 0
+        self._bot = None
+        self.pbar = None
+
+    def _on_read(self, bytes_read):
+        self.pbar.update(bytes_read - self.uploaded)
+        self.uploaded = bytes_read
+        if self.status_message is None or not self.file_size:
+            return
+
+        percent = self.uploaded * 100 // self.file_size
+        if percent - self._reported_percent >= PROGRESS_STEP:
+            self._reported_percent = percent
+            status_editor.update(
+                self._bot,
+                self.status_message.chat_id,
+                self.status_message.message_id,
+                f"{self.status_message.text} {percent}%",
+            )
+
+    async def upload(self, bot, chat_id, caption=None, as_voice=False, audio_tags=None, video_info=None):
+        self._bot = bot
+        self.pbar = tqdm(total=self.file_size, unit='B', unit_scale=True, desc="Uploading")
+        if isinstance(self.source, bytes):
+            file = io.BytesIO(self.source)
+        else:
+            file = open(self.source, 'rb')
+        filename = self.filename or (None if isinstance(self.source, bytes) else os.path.basename(self.source))
+
+        # read_file_handle=False hands the file object to httpx, which pulls
+        # it in chunks while the request body is actually being sent.
+        reader = CountingReader(file, self._on_read)
+        input_file = InputFile(reader, filename=filename, read_file_handle=False)
+        try:
+            if as_voice:
+                return await bot.send_voice(
+                    chat_id=chat_id,
+                    voice=input_file,
+                    caption=caption,
+                    read_timeout=UPLOAD_TIMEOUT,
+                    write_timeout=UPLOAD_TIMEOUT
+                )
+            if audio_tags is not None:
+                return await bot.send_audio(
+                    chat_id=chat_id,
+                    audio=input_file,
+                    caption=caption,
+                    title=audio_tags.get("title"),
+                    performer=audio_tags.get("performer"),
+                    duration=audio_tags.get("duration"),
+                    read_timeout=UPLOAD_TIMEOUT,
+                    write_timeout=UPLOAD_TIMEOUT
+                )
+            if video_info is not None:
+                # ffmpeg may have produced no frame to grab; the video still
+                # goes out, just with Telegram's own preview.
+                thumbnail_path = video_info.get("thumbnail")
+                thumbnail = open(thumbnail_path, 'rb') if thumbnail_path and os.path.exists(thumbnail_path) else None
+                try:
+                    return await bot.send_video(
+                        chat_id=chat_id,
+                        video=input_file,
+                        caption=caption,
+                        duration=int(video_info["duration"]) if video_info.get("duration") else None,
+                        width=video_info.get("width"),
+                        height=video_info.get("height"),
+                        thumbnail=thumbnail,
+                        supports_streaming=True,
+                        read_timeout=UPLOAD_TIMEOUT,
+                        write_timeout=UPLOAD_TIMEOUT
+                    )
+                finally:
+                    if thumbnail is not None:
+                        thumbnail.close()
+            return await bot.send_document(
+                chat_id=chat_id,
+                document=input_file,
+                caption=caption,
+                read_timeout=UPLOAD_TIMEOUT,
+                write_timeout=UPLOAD_TIMEOUT
+            )
+        finally:
+            reader.close()
+            self.pbar.close()
+            if self.status_message is not None:
+                status_editor.discard(self.status_message.chat_id, self.status_message.message_id)
+
+class FairLimiter:
+    def __init__(self, limit, per_chat_limit):
+        self.limit = limit
+        self.per_chat_limit = per_chat_limit
+        self.active = 0
+        self._active_per_chat = {}
+        self._waiters = OrderedDict()
+
+    def _can_run(self, chat_id):
+        return (
+            self.active < self.limit
+            and self._active_per_chat.get(chat_id, 0) < self.per_chat_limit
+        )
+
+    def _grant(self, chat_id):
+        self.active += 1
+        self._active_per_chat[chat_id] = self._active_per_chat.get(chat_id, 0) + 1
+
+    def queued(self):
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    async def acquire(self, chat_id):
+        if chat_id not in self._waiters and self._can_run(chat_id):
+            self._grant(chat_id)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(chat_id, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(chat_id)
+            else:
+                waiters = self._waiters.get(chat_id)
+                if waiters and future in waiters:
+                    waiters.remove(future)
+                    if not waiters:
+                        del self._waiters[chat_id]
+            raise
+
+    def release(self, chat_id):
+        self.active -= 1
+        self._active_per_chat[chat_id] -= 1
+        if not self._active_per_chat[chat_id]:
+            del self._active_per_chat[chat_id]
+        self._wake()
+
+    def _wake(self):
+        # Round-robin over chats: each grant moves that chat to the back of
+        # the line, so one busy chat cannot starve the others.
+        granted = True
+        while granted and self.active < self.limit:
+            granted = False
+            for chat_id in list(self._waiters):
+                if not self._can_run(chat_id):
+                    continue
+                waiters = self._waiters[chat_id]
+                while waiters and waiters[0].done():
+                    waiters.popleft()
+                if waiters:
+                    self._grant(chat_id)
+                    waiters.popleft().set_result(None)
+                    granted = True
+                if waiters:
+                    self._waiters.move_to_end(chat_id)
+                else:
+                    del self._waiters[chat_id]
+                if granted:
+                    break
+
+class TransferService:
+    # Limits how many Telegram transfers run at once, not how fast they go;
+    # the bandwidth scheduler only paces yt-dlp downloads.
+    def __init__(self, limit, per_chat_limit, large_limit, large_threshold):
+        self.large_threshold = large_threshold
+        self._limiter = FairLimiter(limit, per_chat_limit)
+        self._large_limiter = FairLimiter(large_limit, large_limit)
+        self.in_flight_bytes = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @asynccontextmanager
+    async def slot(self, chat_id, size=0):
+        queued_at = time.monotonic()
+        large = size >= self.large_threshold
+        if large:
+            await self._large_limiter.acquire(chat_id)
+        try:
+            await self._limiter.acquire(chat_id)
+        except BaseException:
+            if large:
+                self._large_limiter.release(chat_id)
+            raise
+
+        wait = time.monotonic() - queued_at
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.in_flight_bytes += size
+        try:
+            yield
+        finally:
+            self.in_flight_bytes -= size
+            self.completed += 1
+            self._limiter.release(chat_id)
+            if large:
+                self._large_limiter.release(chat_id)
+
+    async def download(self, bot, file, path, chat_id):
+        async with self.slot(chat_id, file.file_size or 0):
+            file_obj = await bot.get_file(file.file_id)
+            await file_obj.download_to_drive(custom_path=path)
+        return path
+
+    async def upload(self, bot, chat_id, source, caption=None, as_voice=False, filename=None, status_message=None, audio_tags=None, video_info=None):
+        uploader = ProgressUploader(source, filename=filename, status_message=status_message)
+        async with self.slot(chat_id, uploader.file_size):
+            return await uploader.upload(
+                bot, chat_id, caption=caption, as_voice=as_voice, audio_tags=audio_tags, video_info=video_info
+            )
+
+    def metrics(self):
+        return {
+            "in_flight": self._limiter.active,
+            "in_flight_bytes": self.in_flight_bytes,
+            "queued": self._limiter.queued() + self._large_limiter.queued(),
+            "completed": self.completed,
+            "avg_wait": self.total_wait / self.completed if self.completed else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+transfer_service = TransferService(
+    limit=TRANSFER_GLOBAL_LIMIT,
+    per_chat_limit=TRANSFER_PER_CHAT_LIMIT,
+    large_limit=LARGE_TRANSFER_LIMIT,
+    large_threshold=LARGE_FILE_THRESHOLD,
+)
@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import subprocess
+import time
+
+from bot.utils.transcoder import TranscodeService
+
+FFMPEG_BINARY = 'ffmpeg'
+FFPROBE_BINARY = 'ffprobe'
+
+COMPRESSION_ENABLED = True
+COMPRESS_PRESET = 'veryfast'
+COMPRESS_THREADS = 2
+COMPRESS_WORKERS = 1
+COMPRESS_MAX_QUEUE = 2
+# Wall-clock budget for one encode; longer jobs are refused up front.
+COMPRESS_TIME_LIMIT = 300
+COMPRESS_AUDIO_BITRATE = 96
+MIN_VIDEO_BITRATE = 200
+# Muxing overhead and rate-control overshoot of a single-pass encode.
+COMPRESS_SIZE_MARGIN = 0.9
+# Largest download worth squeezing; beyond this the source alone costs more
+# than the upload we are trying to save.
+COMPRESS_MAX_SOURCE_SIZE = 300 * 1024 * 1024
+# Starting guess, in seconds of encoding per minute of video, until real
+# encodes have been measured.
+ENCODE_SECONDS_PER_MINUTE = {
+    'ultrafast': 6.0,
+    'superfast': 9.0,
+    'veryfast': 12.0,
+    'faster': 20.0,
+    'fast': 30.0,
+    'medium': 45.0,
+}
+ENCODE_RATE_SMOOTHING = 0.3
+# (minimum video kbps, output height): low bitrates look better at a lower
+# resolution than as a blocky full-size picture.
+HEIGHT_LADDER = ((1500, 720), (700, 480), (350, 360), (0, 240))
+
+# Codecs Telegram clients play inline from an MP4; anything else is sent as
+# a plain document.
+STREAMABLE_VIDEO_CODECS = ('h264',)
+STREAMABLE_AUDIO_CODECS = ('aac', None)
+# Telegram ignores thumbnails larger than 320 px on either side.
+THUMBNAIL_SIZE = 320
+THUMBNAIL_AT = 1.0
+STREAMABLE_TIMEOUT = 120
+
+def probe_video(file_path, timeout=30):
+    command = [
+        FFPROBE_BINARY, "-v", "error",
+        "-show_entries", "format=duration:stream=codec_type,codec_name,width,height",
+        "-of", "json",
+        file_path,
+    ]
+    result = subprocess.run(command, check=True, capture_output=True, timeout=timeout)
+    probe = json.loads(result.stdout or b"{}")
+    streams = probe.get("streams") or []
+    video = next((stream for stream in streams if stream.get("codec_type") == "video"), {})
+    audio = next((stream for stream in streams if stream.get("codec_type") == "audio"), {})
+    duration = probe.get("format", {}).get("duration")
+    return {
+        "duration": float(duration) if duration else None,
+        "video_codec": video.get("codec_name"),
+        "audio_codec": audio.get("codec_name"),
+        "width": video.get("width"),
+        "height": video.get("height"),
+    }
+
+def target_video_bitrate(duration, max_size):
+    total_kbps = max_size * 8 / 1000 * COMPRESS_SIZE_MARGIN / duration
+    return int(total_kbps - COMPRESS_AUDIO_BITRATE)
+
+def output_height(video_kbps):
+    for min_kbps, height in HEIGHT_LADDER:
+        if video_kbps >= min_kbps:
+            return height
+
+def compress_video(source, output, max_size, preset=COMPRESS_PRESET, threads=COMPRESS_THREADS, timeout=None, duration=None):
+    if duration is None:
+        duration = probe_video(source)["duration"]
+    video_kbps = target_video_bitrate(duration, max_size)
+    height = output_height(video_kbps)
+    command = [
+        FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y",
+        "-i", source,
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-vf", f"scale=-2:'min({height},ih)'",
+        "-c:v", "libx264",
+        "-preset", preset,
+        "-threads", str(threads),
+        "-b:v", f"{video_kbps}k",
+        "-maxrate", f"{video_kbps * 3 // 2}k",
+        "-bufsize", f"{video_kbps * 2}k",
+        "-pix_fmt", "yuv420p",
+        "-c:a", "aac",
+        "-b:a", f"{COMPRESS_AUDIO_BITRATE}k",
+        "-ac", "2",
+        "-movflags", "+faststart",
+        output,
+    ]
+    started = time.monotonic()
+    try:
+        subprocess.run(command, check=True, capture_output=True, timeout=timeout)
+    except subprocess.CalledProcessError as e:
+        if os.path.exists(output):
+            os.remove(output)
+        raise RuntimeError(f"ffmpeg failed: {e.stderr.decode(errors='replace').strip()}") from e
+    except subprocess.TimeoutExpired:
+        if os.path.exists(output):
+            os.remove(output)
+        raise
+    return output, os.path.getsize(output), duration, time.monotonic() - started
+
+def make_streamable(source, output, thumbnail, timeout=STREAMABLE_TIMEOUT):
+    # One probe gives everything send_video needs; one ffmpeg run then
+    # copies H.264/AAC streams into an MP4 with the moov atom up front, so
+    # playback starts after the first few hundred KB, and grabs a thumbnail.
+    info = probe_video(source)
+    streamable = (
+        info["video_codec"] in STREAMABLE_VIDEO_CODECS
+        and info["audio_codec"] in STREAMABLE_AUDIO_CODECS
+    )
+    seek = min(THUMBNAIL_AT, (info["duration"] or 0) / 2)
+    command = [FFMPEG_BINARY, "-hide_banner", "-loglevel", "error", "-y", "-i", source]
+    if streamable:
+        command += [
+            "-map", "0:v:0", "-map", "0:a:0?",
+            "-c", "copy",
+            "-movflags", "+faststart",
+            output,
+        ]
+    command += [
+        "-map", "0:v:0",
+        "-ss", f"{seek:.2f}",
+        "-frames:v", "1",
+        "-vf", f"scale={THUMBNAIL_SIZE}:{THUMBNAIL_SIZE}:force_original_aspect_ratio=decrease",
+        "-q:v", "5",
+        thumbnail,
+    ]
+    try:
+        subprocess.run(command, check=True, capture_output=True, timeout=timeout)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        for path in (output, thumbnail):
+            if os.path.exists(path):
+                os.remove(path)
+        if isinstance(e, subprocess.CalledProcessError):
+            raise RuntimeError(f"ffmpeg failed: {e.stderr.decode(errors='replace').strip()}") from e
+        raise
+    if streamable:
+        os.remove(source)
+    return {
+        **info,
+        "path": output if streamable else source,
+        "thumbnail": thumbnail if os.path.exists(thumbnail) else None,
+        "streamable": streamable,
+    }
+
+class VideoCompressor:
+    def __init__(self, preset, time_limit, workers, max_queue):
+        self.preset = preset
+        self.time_limit = time_limit
+        self.seconds_per_minute = ENCODE_SECONDS_PER_MINUTE.get(preset, 30.0)
+        self.encodes = 0
+        self.encoded_minutes = 0.0
+        self.encode_seconds = 0.0
+        self._service = TranscodeService(max_workers=workers, max_queue=max_queue, job_timeout=time_limit)
+
+    def estimate(self, duration, seconds_per_minute=None):
+        return (seconds_per_minute or self.seconds_per_minute) * duration / 60
+
+    def admits(self, duration, max_size, seconds_per_minute=None):
+        # Download worker processes have their own copy of this object, so
+        # they pass in the rate measured by the main process.
+        if not COMPRESSION_ENABLED or not duration:
+            return False
+        if target_video_bitrate(duration, max_size) < MIN_VIDEO_BITRATE:
+            return False
+        return self.estimate(duration, seconds_per_minute) <= self.time_limit
+
+    async def compress(self, source, max_size):
+        output = os.path.splitext(source)[0] + ".compressed.mp4"
+        output, size, duration, elapsed = await self._service.run(
+            compress_video, source, output, max_size, self.preset, COMPRESS_THREADS, self.time_limit
+        )
+        per_minute = elapsed / (duration / 60) if duration else 0.0
+        if per_minute:
+            self.seconds_per_minute += ENCODE_RATE_SMOOTHING * (per_minute - self.seconds_per_minute)
+        self.encodes += 1
+        self.encoded_minutes += duration / 60 if duration else 0.0
+        self.encode_seconds += elapsed
+        logging.info(
+            f"Compressed {duration / 60:.1f} min of video to {size / 1024 / 1024:.1f} MB in {elapsed:.1f}s "
+            f"({per_minute:.1f}s per minute of video, preset {self.preset})"
+        )
+        return output, size
+
+    def stats(self):
+        return {
+            "encodes": self.encodes,
+            "seconds_per_minute": self.seconds_per_minute,
+            "average_seconds_per_minute": self.encode_seconds / self.encoded_minutes if self.encoded_minutes else 0.0,
+        }
+
+    def shutdown(self):
+        self._service.shutdown()
+
+video_compressor = VideoCompressor(
+    preset=COMPRESS_PRESET,
+    time_limit=COMPRESS_TIME_LIMIT,
+    workers=COMPRESS_WORKERS,
+    max_queue=COMPRESS_MAX_QUEUE,
+)
@@ -1,35 +1,187 @@
 from pytube import YouTube
-import re
-import yt_dlp
+import functools
 import os
-import time
+import subprocess
+import tempfile
 import logging
-from telegram import Update, InputFile
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import CallbackContext
 import asyncio
-from tqdm import tqdm
+from bot.utils.transfer import transfer_service, sanitize_filename
+from bot.utils.ytdlp_workers import youtube_workers, youtube_dl, use_format
+from bot.utils.cache import PersistentLRUCache, CACHE_PATH
+from bot.utils.single_flight import SingleFlight
+from bot.utils.scratch import scratch_space
+from bot.utils.download_queue import download_queue, DEFAULT_PRIORITY
+from bot.utils.status_message import StatusMessage, status_editor
+from bot.utils.video_compressor import (
+    video_compressor,
+    target_video_bitrate,
+    output_height,
+    make_streamable,
+    COMPRESSION_ENABLED,
+    COMPRESS_MAX_SOURCE_SIZE,
+)
+from bot.utils.cooldown import CooldownManager
+from bot.utils.link_extractor import extract_video_ids, has_youtube_link, canonical_video_url, is_video_id
 
-DOWNLOAD_PATH = 'downloads/'
-
-cooldown_users = {}
 COOLDOWN_TIME = 60
+youtube_cooldown = CooldownManager(COOLDOWN_TIME)
+# Links that need a metadata lookup; cached ones are answered regardless.
+METADATA_COOLDOWN_TIME = 10
+metadata_cooldown = CooldownManager(METADATA_COOLDOWN_TIME)
+# A lookup only reads the watch page; it must not hold a worker the way a
+# download may.
+METADATA_TIMEOUT = 30
 
-def sanitize_filename(filename):
-    return "".join(c for c in filename if c.isalnum() or c in (' ', '.', '_')).rstrip()
-
-def download_youtube_video(url, download_path):
-    ydl_opts = {
-        'outtmpl': f'{download_path}/%(title)s.%(ext)s',
-        'format': 'best',
-        'noplaylist': True,
-        'quiet': True,
-        'no_warnings': True,
-        'timeout': 60,
-    }
+YOUTUBE_CACHE_MAX_ENTRIES = 10000
+YOUTUBE_CACHE_TTL = 30 * 24 * 60 * 60
+VIDEO_FORMAT = "video"
+AUDIO_FORMAT = "audio"
+# Qualities offered on link replies: format name -> maximum height.
+VIDEO_QUALITIES = {"360": 360, "720": 720}
+YOUTUBE_METADATA_MAX_ENTRIES = 5000
+YOUTUBE_METADATA_TTL = 6 * 60 * 60
+# kbps; YouTube's ~70k opus stream is the usual pick for music.
+MIN_AUDIO_BITRATE = 64
+YOUTUBE_BATCH_CONCURRENCY = 2
+
+youtube_file_cache = PersistentLRUCache(
+    os.path.join(CACHE_PATH, 'youtube_cache.json'), YOUTUBE_CACHE_MAX_ENTRIES, ttl=YOUTUBE_CACHE_TTL
+)
+youtube_metadata_cache = PersistentLRUCache(
+    os.path.join(CACHE_PATH, 'youtube_metadata.json'), YOUTUBE_METADATA_MAX_ENTRIES, ttl=YOUTUBE_METADATA_TTL
+)
+youtube_flights = SingleFlight()
+
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+# Merged video+audio and container overhead land a little above the sum of
+# the announced stream sizes.
+SIZE_SAFETY_MARGIN = 0.95
+
+class VideoTooLargeError(Exception):
+    def __init__(self, smallest_size):
+        super().__init__(f"smallest available format is {smallest_size / 1024 / 1024:.1f} MB")
+        self.smallest_size = smallest_size
+
+def estimate_format_size(fmt, duration):
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return size
+    if fmt.get('tbr') and duration:
+        return fmt['tbr'] * 1000 / 8 * duration
+    return None
+
+def has_video(fmt):
+    return fmt.get('vcodec') not in (None, 'none')
+
+def has_audio(fmt):
+    return fmt.get('acodec') not in (None, 'none')
+
+def is_avc(fmt):
+    return (fmt.get('vcodec') or '').startswith(('avc1', 'h264'))
+
+def select_format(info, max_size, max_height=None):
+    duration = info.get('duration')
+    formats = info.get('formats') or [info]
+
+    audio_formats = [
+        (fmt, estimate_format_size(fmt, duration))
+        for fmt in formats if has_audio(fmt) and not has_video(fmt)
+    ]
+    audio_formats = [(fmt, size) for fmt, size in audio_formats if size]
+
+    candidates = []
+    for fmt in formats:
+        if not has_video(fmt):
+            continue
+        if max_height and (fmt.get('height') or 0) > max_height:
+            continue
+        size = estimate_format_size(fmt, duration)
+        if not size:
+            continue
+        # At equal height, H.264 wins over VP9/AV1: it remuxes into a
+        # streamable MP4 instead of going out as a document.
+        quality = (fmt.get('height') or 0, is_avc(fmt), fmt.get('tbr') or 0)
+        if has_audio(fmt):
+            candidates.append((quality, size, fmt['format_id']))
+            continue
+        # Video-only stream: pair it with the best audio that still fits,
+        # preferring one that muxes into the same container.
+        for audio, audio_size in sorted(
+            audio_formats,
+            key=lambda item: (item[0].get('ext') == fmt.get('ext') or (fmt.get('ext') == 'mp4' and item[0].get('ext') == 'm4a'), item[0].get('abr') or 0),
+            reverse=True,
+        ):
+            if size + audio_size <= max_size * SIZE_SAFETY_MARGIN:
+                candidates.append((quality, size + audio_size, f"{fmt['format_id']}+{audio['format_id']}"))
+                break
+        else:
+            if audio_formats:
+                audio, audio_size = min(audio_formats, key=lambda item: item[1])
+                candidates.append((quality, size + audio_size, f"{fmt['format_id']}+{audio['format_id']}"))
+
+    fitting = [candidate for candidate in candidates if candidate[1] <= max_size * SIZE_SAFETY_MARGIN]
+    if not fitting:
+        raise VideoTooLargeError(min((candidate[1] for candidate in candidates), default=0))
+
+    quality, size, format_id = max(fitting, key=lambda candidate: (candidate[0], -candidate[1]))
+    return format_id, size
+
+def select_video_format(info, max_size, encode_rate=None, max_height=None):
+    try:
+        return select_format(info, max_size, max_height=max_height)
+    except VideoTooLargeError:
+        duration = info.get('duration')
+        if not video_compressor.admits(duration, max_size, encode_rate):
+            raise
+    # Too big to send as-is but short enough to re-encode in time: fetch a
+    # source no sharper than what the target bitrate can carry.
+    height = output_height(target_video_bitrate(duration, max_size))
+    if max_height:
+        height = min(height, max_height)
+    return select_format(info, COMPRESS_MAX_SOURCE_SIZE, max_height=height)
+
+def select_audio_format(info, max_size):
+    duration = info.get('duration')
+    formats = info.get('formats') or [info]
+    candidates = []
+    for fmt in formats:
+        if has_video(fmt) or not has_audio(fmt):
+            continue
+        size = estimate_format_size(fmt, duration)
+        if not size or size > max_size * SIZE_SAFETY_MARGIN:
+            continue
+        codec = fmt.get('acodec') or ''
+        # sendAudio only plays M4A and MP3; opus in WebM would be stored as
+        # a plain document.
+        preferred = codec.startswith(('mp4a', 'mp3'))
+        candidates.append((preferred, (fmt.get('abr') or 0) >= MIN_AUDIO_BITRATE, size, fmt['format_id']))
+
+    if not candidates:
+        raise VideoTooLargeError(0)
+
+    # Smallest m4a/mp3 stream that still sounds fine for music; anything
+    # else only when YouTube offers nothing better.
+    preferred, good_enough, size, format_id = min(
+        candidates, key=lambda candidate: (not candidate[0], not candidate[1], candidate[2])
+    )
+    return format_id, size
+
+def fetch_youtube_media(url, download_path, choose_format, cancel_event=None, bandwidth=None):
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info_dict = ydl.extract_info(url, download=True)
-            video_path = ydl.prepare_filename(info_dict)
+        with youtube_dl(download_path, MAX_UPLOAD_SIZE, cancel_event, bandwidth) as ydl:
+            # Pre-flight: only metadata is fetched, so an oversized video is
+            # refused before a single media byte is transferred.
+            info_dict = ydl.extract_info(url, download=False)
+            format_id, expected_size = choose_format(info_dict, MAX_UPLOAD_SIZE)
+            logging.info(f"Selected format {format_id} (~{expected_size / 1024 / 1024:.1f} MB) for {url}")
+
+            use_format(ydl, format_id, max(MAX_UPLOAD_SIZE, int(expected_size / SIZE_SAFETY_MARGIN)))
+            info_dict = ydl.process_ie_result(info_dict, download=True)
+            requested = info_dict.get('requested_downloads') or [{}]
+            video_path = requested[0].get('filepath') or ydl.prepare_filename(info_dict)
             sanitized_title = sanitize_filename(info_dict.get('title', 'video'))
             extension = os.path.splitext(video_path)[1]
             new_video_path = os.path.join(download_path, f"{sanitized_title}{extension}")
@@ -40,80 +192,387 @@ def download_youtube_video(url, download_path):
                 counter += 1
 
             os.rename(video_path, new_video_path)
-            return new_video_path, sanitized_title
+            return new_video_path, info_dict, format_id
+    except VideoTooLargeError:
+        raise
     except Exception as e:
         logging.error(f"Error downloading video: {e}")
         raise e
 
-YT_LINK_REGEX = r"(https?://)?(www\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/(watch\?v=|embed/|v/|.+\?v=)?([^&=%\?]{11})"
+def download_youtube_video(url, download_path, cancel_event=None, encode_rate=None, max_height=None, bandwidth=None):
+    choose_format = functools.partial(select_video_format, encode_rate=encode_rate, max_height=max_height)
+    video_path, info_dict, format_id = fetch_youtube_media(url, download_path, choose_format, cancel_event, bandwidth)
+    return video_path, sanitize_filename(info_dict.get('title', 'video')), format_id
 
-def is_youtube_link(text):
-    return re.match(YT_LINK_REGEX, text) is not None
+def summarize_formats(info, encode_rate=None):
+    # Estimated size of what each offered quality would download, chosen the
+    # same way the download chooses it; a quality that cannot be sent shows
+    # its smallest size and the caller leaves it without a button.
+    qualities = {}
+    seen_formats = set()
+    too_large = set()
+    try:
+        qualities[AUDIO_FORMAT] = select_audio_format(info, MAX_UPLOAD_SIZE)[1]
+    except VideoTooLargeError:
+        pass
+    for name, height in VIDEO_QUALITIES.items():
+        try:
+            format_id, size = select_video_format(info, MAX_UPLOAD_SIZE, encode_rate=encode_rate, max_height=height)
+        except VideoTooLargeError as e:
+            if e.smallest_size and e.smallest_size not in too_large:
+                too_large.add(e.smallest_size)
+                qualities[name] = e.smallest_size
+            continue
+        # A video that tops out at 360p offers the same stream for 720p.
+        if format_id not in seen_formats:
+            seen_formats.add(format_id)
+            qualities[name] = size
+    return qualities
+
+def fetch_video_metadata(url, cancel_event=None, encode_rate=None):
+    with youtube_dl(tempfile.gettempdir(), MAX_UPLOAD_SIZE, cancel_event) as ydl:
+        info_dict = ydl.extract_info(url, download=False)
+    return {
+        "title": info_dict.get('title', 'video'),
+        "duration": info_dict.get('duration'),
+        "qualities": summarize_formats(info_dict, encode_rate),
+    }
+
+def download_youtube_audio(url, download_path, cancel_event=None, bandwidth=None):
+    audio_path, info_dict, format_id = fetch_youtube_media(url, download_path, select_audio_format, cancel_event, bandwidth)
+    tags = {
+        "title": info_dict.get('track') or info_dict.get('title', 'audio'),
+        "performer": info_dict.get('artist') or info_dict.get('uploader'),
+        "duration": int(info_dict['duration']) if info_dict.get('duration') else None,
+    }
+    return audio_path, tags, format_id
 
-async def download_youtube_video_handler(update: Update, context: CallbackContext) -> None:
+def youtube_cache_key(video_id, format_name):
+    return f"{video_id}:{format_name}"
+
+def video_caption(title, url):
+    return f"این هم ویدیوی شما.\n\n{title}\n\n{url}\n\n@Typology_Theories_Bot"
+
+async def send_cached_video(bot, chat_id, cache_key, url):
+    cached = youtube_file_cache.get(cache_key)
+    if cached is None:
+        return None
+    try:
+        if cached.get("kind") == AUDIO_FORMAT:
+            return await bot.send_audio(
+                chat_id=chat_id, audio=cached["file_id"], caption=video_caption(cached["title"], url)
+            )
+        if cached.get("kind") == VIDEO_FORMAT:
+            return await bot.send_video(
+                chat_id=chat_id, video=cached["file_id"], caption=video_caption(cached["title"], url),
+                supports_streaming=True,
+            )
+        return await bot.send_document(
+            chat_id=chat_id, document=cached["file_id"], caption=video_caption(cached["title"], url)
+        )
+    except BadRequest as e:
+        logging.warning(f"Cached video {cache_key} rejected, dropping it: {e}")
+        youtube_file_cache.delete(cache_key)
+        return None
+
+def video_scratch_reserve():
+    # The format is only chosen inside the worker, so reserve for the worst
+    # case: a compression source plus its output, or a video plus its
+    # streamable copy.
+    if COMPRESSION_ENABLED:
+        return COMPRESS_MAX_SOURCE_SIZE + MAX_UPLOAD_SIZE
+    return 2 * MAX_UPLOAD_SIZE
+
+async def deliver_video(bot, chat_id, url, start_msg=None, max_height=None, priority=DEFAULT_PRIORITY):
+    async with scratch_space.job_dir(video_scratch_reserve()) as job_path:
+        async with transfer_service.slot(chat_id):
+            video_path, video_title, format_id = await youtube_workers.run(
+                download_youtube_video, url, job_path, priority=priority,
+                encode_rate=video_compressor.seconds_per_minute, max_height=max_height,
+            )
+
+        file_size = os.path.getsize(video_path)
+        # What is left to write is one more file of at most upload size: the
+        # compressed output or the streamable copy.
+        await scratch_space.shrink(job_path, file_size + MAX_UPLOAD_SIZE)
+        if file_size > MAX_UPLOAD_SIZE:
+            if start_msg is not None:
+                await start_msg.edit_text("ویدیو بزرگتر از 50 مگابایت است، در حال فشرده‌سازی...")
+            source_path = video_path
+            video_path, file_size = await video_compressor.compress(source_path, MAX_UPLOAD_SIZE)
+            os.remove(source_path)
+            if file_size > MAX_UPLOAD_SIZE:
+                raise VideoTooLargeError(file_size)
+
+        base_path = os.path.splitext(video_path)[0]
+        try:
+            video_info = await asyncio.to_thread(
+                make_streamable, video_path, base_path + ".stream.mp4", base_path + ".thumb.jpg"
+            )
+        except (OSError, RuntimeError, subprocess.SubprocessError) as e:
+            logging.error(f"Error preparing {video_path} for streaming, sending it as a file: {e}")
+            video_info = None
+        if video_info is not None:
+            video_path = video_info["path"]
+            if not video_info["streamable"] or os.path.getsize(video_path) > MAX_UPLOAD_SIZE:
+                video_info = None
+
+        if start_msg is not None:
+            await start_msg.edit_text("در حال آپلود ویدیو...")
+        video_message = await transfer_service.upload(
+            bot,
+            chat_id,
+            video_path,
+            caption=video_caption(video_title, url),
+            status_message=start_msg,
+            video_info=video_info
+        )
+        if video_info is not None:
+            return {
+                "kind": VIDEO_FORMAT,
+                "file_id": video_message.video.file_id,
+                "format_id": format_id,
+                "title": video_title,
+            }
+        return {
+            "file_id": video_message.document.file_id,
+            "format_id": format_id,
+            "title": video_title,
+        }
+
+async def deliver_audio(bot, chat_id, url, start_msg=None, priority=DEFAULT_PRIORITY):
+    async with scratch_space.job_dir(MAX_UPLOAD_SIZE) as job_path:
+        async with transfer_service.slot(chat_id):
+            audio_path, tags, format_id = await youtube_workers.run(
+                download_youtube_audio, url, job_path, priority=priority
+            )
+
+        file_size = os.path.getsize(audio_path)
+        if file_size > MAX_UPLOAD_SIZE:
+            raise VideoTooLargeError(file_size)
+
+        if start_msg is not None:
+            await start_msg.edit_text("در حال آپلود فایل صوتی...")
+        audio_message = await transfer_service.upload(
+            bot,
+            chat_id,
+            audio_path,
+            caption=video_caption(tags["title"], url),
+            status_message=start_msg,
+            audio_tags=tags
+        )
+        if audio_message.audio is None:
+            # Telegram files codecs it cannot play as documents.
+            return {
+                "file_id": audio_message.document.file_id,
+                "format_id": format_id,
+                "title": tags["title"],
+            }
+        return {
+            "kind": AUDIO_FORMAT,
+            "file_id": audio_message.audio.file_id,
+            "format_id": format_id,
+            "title": tags["title"],
+        }
+
+async def deliver_video_id(bot, chat_id, video_id, media_format=VIDEO_FORMAT, start_msg=None, priority=DEFAULT_PRIORITY):
+    url = canonical_video_url(video_id)
+    cache_key = youtube_cache_key(video_id, media_format)
+    # An earlier job for the same video may have finished while this one
+    # was waiting in the queue.
+    if await send_cached_video(bot, chat_id, cache_key, url):
+        return
+
+    if media_format == AUDIO_FORMAT:
+        deliver = functools.partial(deliver_audio, priority=priority)
+    else:
+        deliver = functools.partial(deliver_video, max_height=VIDEO_QUALITIES.get(media_format), priority=priority)
+
+    async def deliver_and_cache():
+        result = await deliver(bot, chat_id, url, start_msg)
+        youtube_file_cache.set(cache_key, result)
+        return result
+
+    # Reposts of a link that is already being fetched wait for that
+    # job and then get its file_id instead of downloading again; only the
+    # job that did the work writes the cache.
+    _, shared = await youtube_flights.do(cache_key, deliver_and_cache)
+    if shared:
+        await send_cached_video(bot, chat_id, cache_key, url)
+
+async def queue_youtube_links(update: Update, context: CallbackContext, text, media_format) -> None:
     user_id = update.message.from_user.id
-    if user_id in cooldown_users and (time.time() - cooldown_users[user_id]) < COOLDOWN_TIME:
-        remaining_time = COOLDOWN_TIME - (time.time() - cooldown_users[user_id])
+    remaining_time = youtube_cooldown.claim(user_id)
+    if remaining_time:
         await update.message.reply_text(f"لطفاً {remaining_time:.0f} ثانیه صبر کنید.")
         return
 
-    url = update.message.text
-    if is_youtube_link(url):
-        try:
-            start_msg = await update.message.reply_text("در حال دانلود ویدیو...")
+    video_ids = extract_video_ids(text)
+    if not video_ids:
+        youtube_cooldown.release(user_id)
+        return
 
-            video_path, video_title = download_youtube_video(url, DOWNLOAD_PATH)
-            
-            file_size = os.path.getsize(video_path)
-            if file_size > 50 * 1024 * 1024:
-                await update.message.reply_text("ویدیو باید کمتر از 50 مگابایت باشد. لطفا ویدیو کوچکتری انتخاب کنید.")
-                return
-            
-            uploader = ProgressUploader(video_path)
-            await uploader.upload(
-                context.bot,
-                update.message.chat_id,
-                caption=f"این هم ویدیوی شما.\n\n{video_title}\n\n{url}\n\n@Typology_Theories_Bot"
+    chat_id = update.message.chat_id
+    pending = []
+    for video_id in video_ids:
+        cache_key = youtube_cache_key(video_id, media_format)
+        if not await send_cached_video(context.bot, chat_id, cache_key, canonical_video_url(video_id)):
+            pending.append(video_id)
+
+    if pending:
+        noun = "فایل صوتی" if media_format == AUDIO_FORMAT else "ویدیو"
+        status_text = f"در حال دانلود {noun}..." if len(pending) == 1 else f"در حال دانلود {len(pending)} {noun}..."
+        await download_queue.submit(
+            context.bot, update.message, "youtube", {"video_ids": pending, "format": media_format}, status_text
+        )
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds or 0), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+def quality_label(name):
+    return "صدا" if name == AUDIO_FORMAT else f"{name}p"
+
+def can_deliver(size, duration):
+    if size <= MAX_UPLOAD_SIZE:
+        return True
+    return size <= COMPRESS_MAX_SOURCE_SIZE and video_compressor.admits(duration, MAX_UPLOAD_SIZE)
+
+async def get_video_metadata(video_id):
+    metadata = youtube_metadata_cache.get(video_id)
+    if metadata is None:
+        metadata, _ = await youtube_flights.do(
+            f"metadata:{video_id}",
+            lambda: youtube_workers.run(
+                fetch_video_metadata, canonical_video_url(video_id),
+                timeout=METADATA_TIMEOUT, encode_rate=video_compressor.seconds_per_minute,
+            ),
+        )
+        youtube_metadata_cache.set(video_id, metadata)
+    return metadata
+
+def metadata_reply(video_id, metadata):
+    lines = [metadata["title"], "", f"مدت: {format_duration(metadata['duration'])}", "", "حجم تقریبی:"]
+    buttons = []
+    for name, size in metadata["qualities"].items():
+        lines.append(f"{quality_label(name)}: {size / 1024 / 1024:.1f} MB")
+        if can_deliver(size, metadata["duration"]):
+            buttons.append(InlineKeyboardButton(quality_label(name), callback_data=f"yt:{name}:{video_id}"))
+    return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+async def reply_video_metadata(update: Update, context: CallbackContext, video_id) -> None:
+    try:
+        metadata = await get_video_metadata(video_id)
+    except Exception as e:
+        logging.error(f"Error fetching metadata for {video_id}: {e}")
+        await update.message.reply_text("اطلاعات ویدیو دریافت نشد.")
+        return
+    text, keyboard = metadata_reply(video_id, metadata)
+    await update.message.reply_text(text, reply_markup=keyboard)
+
+async def youtube_link_handler(update: Update, context: CallbackContext) -> None:
+    # Links only get a metadata reply; nothing is downloaded until someone
+    # picks a quality.
+    video_ids = extract_video_ids(update.message.text)
+    if any(youtube_metadata_cache.get(video_id) is None for video_id in video_ids):
+        remaining_time = metadata_cooldown.claim(update.message.from_user.id)
+        if remaining_time:
+            await update.message.reply_text(f"لطفاً {remaining_time:.0f} ثانیه صبر کنید.")
+            return
+    await asyncio.gather(*(reply_video_metadata(update, context, video_id) for video_id in video_ids))
+
+async def youtube_quality_callback(update: Update, context: CallbackContext) -> None:
+    query = update.callback_query
+    try:
+        _, media_format, video_id = query.data.split(":", 2)
+    except ValueError:
+        await query.answer()
+        return
+    # Callback data comes from the client; anything the bot could not have
+    # put on a button must not reach yt-dlp or the file cache.
+    if not is_video_id(video_id) or (media_format != AUDIO_FORMAT and media_format not in VIDEO_QUALITIES):
+        await query.answer()
+        return
+
+    user_id = query.from_user.id
+    remaining_time = youtube_cooldown.claim(user_id)
+    if remaining_time:
+        await query.answer(f"لطفاً {remaining_time:.0f} ثانیه صبر کنید.")
+        return
+
+    await query.answer()
+    chat_id = query.message.chat_id
+    cache_key = youtube_cache_key(video_id, media_format)
+    if not await send_cached_video(context.bot, chat_id, cache_key, canonical_video_url(video_id)):
+        noun = "فایل صوتی" if media_format == AUDIO_FORMAT else f"ویدیو ({quality_label(media_format)})"
+        await download_queue.submit(
+            context.bot, query.message, "youtube", {"video_ids": [video_id], "format": media_format},
+            f"در حال دانلود {noun}...", user_id=user_id,
+        )
+
+async def download_youtube_audio_handler(update: Update, context: CallbackContext) -> None:
+    text = " ".join(context.args) if context.args else ""
+    if not has_youtube_link(text) and update.message.reply_to_message:
+        text = update.message.reply_to_message.text or update.message.reply_to_message.caption or ""
+    if not has_youtube_link(text):
+        await update.message.reply_text(
+            "لطفاً لینک یوتیوب را بعد از دستور بفرستید یا این دستور را با ریپلای به پیام لینک ارسال کنید. مثال: /audio https://youtu.be/..."
+        )
+        return
+    await queue_youtube_links(update, context, text, AUDIO_FORMAT)
+
+async def process_youtube_job(bot, job) -> None:
+    chat_id = job["chat_id"]
+    payload = job["payload"]
+    start_msg = StatusMessage(bot, chat_id, payload["status_message_id"], payload["status_text"])
+    video_ids = payload["video_ids"]
+    media_format = payload.get("format", VIDEO_FORMAT)
+    finished = payload.setdefault("finished", [])
+    single = len(video_ids) == 1
+    semaphore = asyncio.Semaphore(YOUTUBE_BATCH_CONCURRENCY)
+
+    async def deliver(video_id):
+        async with semaphore:
+            # A batch shares one status message, so only a lone video
+            # reports its own upload progress there.
+            await deliver_video_id(
+                bot, chat_id, video_id, media_format, start_msg if single else None, job.get("priority", DEFAULT_PRIORITY)
             )
-            
-            await context.bot.delete_message(chat_id=update.message.chat_id, message_id=start_msg.message_id)
+        finished.append(video_id)
+        download_queue.save_payload(job)
+        if not single:
+            status_editor.update(bot, chat_id, start_msg.message_id, f"{len(finished)} از {len(video_ids)} ویدیو ارسال شد...")
 
-            cooldown_users[user_id] = time.time()
-            
-        except asyncio.TimeoutError:
-            await update.message.reply_text("خطا در ارسال ویدیو. لطفا دوباره تلاش کنید.")
-        except Exception as e:
-            logging.error(f"Error downloading or sending video: {e}")
-            await update.message.reply_text(f"ویدیو دانلود نشد. لطفا دوباره تلاش کنید.")
-        finally:
-            if os.path.exists(video_path):
-                os.remove(video_path)
-
-class ProgressUploader:
-    def __init__(self, file_path):
-        self.file_path = file_path
-        self.file_size = os.path.getsize(file_path)
-        self.uploaded = 0
-        self.pbar = tqdm(total=self.file_size, unit='B', unit_scale=True, desc="Uploading")
-
-    async def upload(self, bot, chat_id, caption=None):
-        with open(self.file_path, 'rb') as file:
-            input_file = InputFile(file)
-            try:
-                message = await bot.send_document(
-                    chat_id=chat_id,
-                    document=input_file,
-                    caption=caption,
-                    read_timeout=300,
-                    write_timeout=300
-                )
-                
-                chunk_size = 1024 * 1024
-                while self.uploaded < self.file_size:
-                    self.uploaded = min(self.uploaded + chunk_size, self.file_size)
-                    self.pbar.update(min(chunk_size, self.file_size - self.pbar.n))
-                    await asyncio.sleep(0.1)
-                
-                return message
-            finally:
-                self.pbar.close()
+    pending = [video_id for video_id in video_ids if video_id not in finished]
+    results = await asyncio.gather(*(deliver(video_id) for video_id in pending), return_exceptions=True)
+
+    too_large = []
+    errors = []
+    for video_id, result in zip(pending, results):
+        if isinstance(result, VideoTooLargeError):
+            logging.info(f"Rejected {video_id}: {result}")
+            too_large.append(video_id)
+            finished.append(video_id)
+        elif isinstance(result, BaseException):
+            errors.append(result)
+    download_queue.save_payload(job)
+
+    # Whatever failed for other reasons is left for the queue to retry;
+    # videos already sent are not sent again.
+    if errors:
+        raise errors[0]
+
+    if too_large:
+        await start_msg.edit_text("ویدیو باید کمتر از 50 مگابایت باشد. لطفا ویدیو کوچکتری انتخاب کنید.")
+    else:
+        await start_msg.delete()
+
+async def youtube_job_failed(bot, job, error) -> None:
+    if isinstance(error, asyncio.TimeoutError):
+        text = "خطا در ارسال ویدیو. لطفا دوباره تلاش کنید."
+    else:
+        text = "ویدیو دانلود نشد. لطفا دوباره تلاش کنید."
+    await StatusMessage(bot, job["chat_id"], job["payload"]["status_message_id"], text).edit_text(text)
+
+download_queue.register("youtube", process_youtube_job, youtube_job_failed)
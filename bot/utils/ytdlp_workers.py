@@ -0,0 +1,274 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+import yt_dlp
+
+from bot.utils.bandwidth import bandwidth_scheduler
+
+YTDLP_WORKERS = 3
+YTDLP_JOB_TIMEOUT = 600
+# The cancel flag lives in a manager process, so checking it is an IPC
+# round trip; progress hooks fire far more often than that is worth.
+CANCEL_CHECK_INTERVAL = 0.5
+# Parallel connections for DASH/HLS formats; plain HTTPS formats still use
+# one.
+FRAGMENT_CONCURRENCY = 4
+# How often a job reports its progress and picks up a new bandwidth share.
+RATE_SYNC_INTERVAL = 1.0
+# Pacing only looks this far back, so a stall is not followed by a burst.
+RATE_WINDOW = 5.0
+
+YDL_OPTIONS = {
+    'outtmpl': '%(title)s.%(ext)s',
+    'noplaylist': True,
+    'quiet': True,
+    'no_warnings': True,
+    'timeout': 60,
+    'merge_output_format': 'mp4',
+    'concurrent_fragment_downloads': FRAGMENT_CONCURRENCY,
+}
+
+# Per-process state of a warm worker.
+_warm_ydl = None
+_default_format_selector = None
+_cancel_event = None
+_last_cancel_check = 0.0
+_throttle = None
+
+def _check_cancelled(progress):
+    global _last_cancel_check
+    if _cancel_event is None or time.monotonic() - _last_cancel_check < CANCEL_CHECK_INTERVAL:
+        return
+    _last_cancel_check = time.monotonic()
+    if _cancel_event.is_set():
+        raise yt_dlp.utils.DownloadCancelled()
+
+class JobThrottle:
+    # Paces one download to the rate the bandwidth scheduler gave it.
+    # yt-dlp's own ratelimit is per connection and copied into every
+    # fragment downloader, so it can neither cap parallel fragments nor
+    # change mid-job; progress hooks run on the downloading threads, and
+    # sleeping there holds them back.
+    def __init__(self, shared):
+        self.shared = shared
+        self.rate = shared.get("rate")
+        self.downloaded = 0
+        self._seen = {}
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._last_sync = self._window_start
+
+    def sync(self):
+        self.shared["downloaded"] = self.downloaded
+        return self.shared.get("rate")
+
+    def __call__(self, progress):
+        with self._lock:
+            # downloaded_bytes is per file and video and audio are fetched
+            # one after the other, so count the growth of each file.
+            name = progress.get('filename')
+            current = progress.get('downloaded_bytes') or 0
+            grown = max(current - self._seen.get(name, 0), 0)
+            self._seen[name] = current
+            self.downloaded += grown
+            self._window_bytes += grown
+
+            now = time.monotonic()
+            if now - self._last_sync >= RATE_SYNC_INTERVAL or progress.get('status') == 'finished':
+                self._last_sync = now
+                rate = self.sync()
+                if rate != self.rate:
+                    self.rate = rate
+                    self._window_start, self._window_bytes = now, 0
+            if now - self._window_start > RATE_WINDOW:
+                self._window_start, self._window_bytes = now, grown
+            if not self.rate:
+                return
+            delay = self._window_bytes / self.rate - (now - self._window_start)
+        if delay > 0:
+            time.sleep(delay)
+
+def _pace(progress):
+    if _throttle is not None:
+        _throttle(progress)
+
+def init_worker():
+    # Runs once per worker process: builds the YoutubeDL every job in this
+    # process reuses and instantiates the YouTube extractor up front.
+    global _warm_ydl, _default_format_selector
+    _warm_ydl = yt_dlp.YoutubeDL({**YDL_OPTIONS, 'progress_hooks': [_check_cancelled, _pace]})
+    _warm_ydl.get_info_extractor('Youtube')
+    _default_format_selector = _warm_ydl.format_selector
+
+def warm_up():
+    return _warm_ydl is not None
+
+@contextmanager
+def youtube_dl(download_path, max_filesize, cancel_event=None, bandwidth=None):
+    # bandwidth is the job's shared dict from YtDlpWorkerPool.run; without
+    # it the download is not paced.
+    global _cancel_event, _last_cancel_check, _throttle
+    throttle = JobThrottle(bandwidth) if bandwidth is not None else None
+    if _warm_ydl is None:
+        # Not inside a warm worker (tests, scripts): build one for this call.
+        def check_cancelled(progress):
+            if cancel_event is not None and cancel_event.is_set():
+                raise yt_dlp.utils.DownloadCancelled()
+
+        with yt_dlp.YoutubeDL({
+            **YDL_OPTIONS,
+            'paths': {'home': download_path},
+            'max_filesize': max_filesize,
+            'progress_hooks': [check_cancelled] + ([throttle] if throttle else []),
+        }) as ydl:
+            try:
+                yield ydl
+            finally:
+                if throttle is not None:
+                    throttle.sync()
+        return
+
+    _warm_ydl.params['paths'] = {'home': download_path}
+    _warm_ydl.params['max_filesize'] = max_filesize
+    _cancel_event = cancel_event
+    _last_cancel_check = 0.0
+    _throttle = throttle
+    try:
+        yield _warm_ydl
+    finally:
+        if throttle is not None:
+            throttle.sync()
+        _cancel_event = None
+        _throttle = None
+        _warm_ydl.params.pop('format', None)
+        _warm_ydl.format_selector = _default_format_selector
+
+def use_format(ydl, format_id, max_filesize):
+    ydl.params['format'] = format_id
+    ydl.params['max_filesize'] = max_filesize
+    ydl.format_selector = ydl.build_format_selector(format_id)
+
+def _log_removal_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        logging.error(f"Error releasing bandwidth share: {future.exception()}")
+
+class YtDlpWorkerPool:
+    # One single-process executor per worker rather than one shared pool: a
+    # job stuck outside the progress hooks (in extract_info, say) never sees
+    # its cancel event, and killing a worker of a shared pool would break
+    # every other job running in it.
+    def __init__(self, max_workers, job_timeout, scheduler=None):
+        self.max_workers = max_workers
+        self.job_timeout = job_timeout
+        self.scheduler = scheduler
+        self._idle = None
+        self._executors = set()
+        self._manager = None
+        self._cancel_events = set()
+
+    def _spawn(self):
+        executor = ProcessPoolExecutor(max_workers=1, initializer=init_worker)
+        self._executors.add(executor)
+        return executor
+
+    def _kill(self, executor):
+        self._executors.discard(executor)
+        for process in list(getattr(executor, '_processes', {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _replace(self, executor):
+        self._kill(executor)
+        replacement = self._spawn()
+        # Warms the new worker before the next job is handed to it.
+        replacement.submit(warm_up)
+        return replacement
+
+    def _get_idle(self):
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for _ in range(self.max_workers):
+                self._idle.put_nowait(self._spawn())
+        return self._idle
+
+    def _get_manager(self):
+        if self._manager is None:
+            self._manager = multiprocessing.Manager()
+        return self._manager
+
+    async def start(self):
+        # One call per worker makes each process spawn now instead of on the
+        # first download.
+        loop = asyncio.get_running_loop()
+        self._get_idle()
+        await loop.run_in_executor(None, self._get_manager)
+        await asyncio.gather(*(loop.run_in_executor(executor, warm_up) for executor in list(self._executors)))
+
+    async def run(self, func, *args, timeout=None, priority=None, **kwargs):
+        # Jobs given a priority download media: they get a bandwidth share
+        # from the scheduler, passed to func as bandwidth=.
+        loop = asyncio.get_running_loop()
+        cancel_event = await loop.run_in_executor(None, self._get_manager().Event)
+        self._cancel_events.add(cancel_event)
+        token = None
+        if priority is not None and self.scheduler is not None:
+            bandwidth = await loop.run_in_executor(None, self._get_manager().dict, {"rate": None, "downloaded": 0})
+            token = await loop.run_in_executor(None, self.scheduler.add, bandwidth, priority)
+            kwargs["bandwidth"] = bandwidth
+        job = functools.partial(func, *args, cancel_event=cancel_event, **kwargs)
+        started = time.monotonic()
+        idle = self._get_idle()
+        executor = None
+        try:
+            executor = await idle.get()
+            future = loop.run_in_executor(executor, job)
+            return await asyncio.wait_for(future, timeout or self.job_timeout)
+        except asyncio.TimeoutError:
+            logging.error(f"yt-dlp job {func.__name__} timed out, replacing its worker")
+            cancel_event.set()
+            executor = self._replace(executor)
+            raise
+        except asyncio.CancelledError:
+            cancel_event.set()
+            if executor is not None:
+                executor = self._replace(executor)
+            raise
+        except BrokenProcessPool:
+            logging.error(f"yt-dlp worker died during {func.__name__}, replacing it")
+            executor = self._replace(executor)
+            raise
+        finally:
+            if executor is not None:
+                idle.put_nowait(executor)
+            self._cancel_events.discard(cancel_event)
+            if token is not None:
+                # Not awaited, so a cancelled job still frees its share.
+                removal = loop.run_in_executor(None, self.scheduler.remove, token, func.__name__, time.monotonic() - started)
+                removal.add_done_callback(_log_removal_error)
+
+    def shutdown(self):
+        for cancel_event in list(self._cancel_events):
+            try:
+                cancel_event.set()
+            except (OSError, EOFError):
+                pass
+        for executor in list(self._executors):
+            self._kill(executor)
+        self._idle = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+youtube_workers = YtDlpWorkerPool(
+    max_workers=YTDLP_WORKERS,
+    job_timeout=YTDLP_JOB_TIMEOUT,
+    scheduler=bandwidth_scheduler,
+)
@@ -10,6 +10,7 @@ from telegram.ext import (
     MessageHandler,
     CallbackContext,
     ChatMemberHandler,
+    CallbackQueryHandler,
     filters,
 )
 from datetime import datetime, timezone
@@ -22,6 +23,7 @@ from bot.handlers.command_handlers import (
     mute,
     unmute,
     delete_message,
+    purge,
     pin_message,
     unpin_message,
     unpin_all_messages,
@@ -32,11 +34,19 @@ from bot.handlers.command_handlers import (
     chat,
     from_command,
 )
-from bot.handlers.message_handlers import greet_new_member, say_goodbye
+from bot.handlers.message_handlers import greet_new_member, say_goodbye, track_admin_changes, record_message
+from bot.utils.youtube_downloader import download_youtube_audio_handler, youtube_quality_callback
 from misc import TELEGRAM_BOT_TOKEN, ADMIN_ID
 from bot.filters.custom_filter import MessageFilter
 from bot.filters.custom_filter import CustomFilters
 from bot.handlers.message_handlers import handle_message
+from bot.utils.transcoder import transcode_service
+from bot.utils.ytdlp_workers import youtube_workers
+from bot.utils.download_queue import download_queue
+from bot.utils.video_compressor import video_compressor
+from bot.utils.scratch import scratch_space
+from bot.utils.audio_demo_creator import demo_cache
+from bot.utils.youtube_downloader import youtube_file_cache, youtube_metadata_cache
 
 load_dotenv()
 
@@ -51,7 +61,7 @@ async def error_handler(update: Update, context: CallbackContext) -> None:
     logging.error(f"Update {update} caused error {context.error}")
 
 async def start_application():
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    application = Application.builder().token(TELEGRAM_BOT_TOKEN).concurrent_updates(True).build()
 
     startup_time = datetime.now(timezone.utc)
     message_filter = MessageFilter(startup_time)
@@ -64,6 +74,7 @@ async def start_application():
     application.add_handler(CommandHandler("mute", mute, filters=combined_filters))
     application.add_handler(CommandHandler("unmute", unmute, filters=message_filter))
     application.add_handler(CommandHandler("del", delete_message, filters=message_filter))
+    application.add_handler(CommandHandler("purge", purge, filters=filters.ChatType.GROUPS & message_filter))
     application.add_handler(CommandHandler("report", report, filters=message_filter))
     application.add_handler(CommandHandler("pin", pin_message, filters=message_filter))
     application.add_handler(CommandHandler("unpin", unpin_message, filters=message_filter))
@@ -72,6 +83,8 @@ async def start_application():
     application.add_handler(CommandHandler("me", my_info, filters=message_filter))
     application.add_handler(CommandHandler("chat_info", chat_info, filters=message_filter))
     application.add_handler(CommandHandler("chat", chat, filters=message_filter))
+    application.add_handler(CommandHandler("audio", download_youtube_audio_handler, filters=message_filter))
+    application.add_handler(CallbackQueryHandler(youtube_quality_callback, pattern=r"^yt:"))
     application.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND) & message_filter, handle_message))
     application.add_handler(MessageHandler(filters.Document.AUDIO | filters.AUDIO, handle_message))
     application.add_handler(CommandHandler("from", from_command))
@@ -85,6 +98,17 @@ async def start_application():
         )
     )
 
+    # Indexes every group message, commands included, before any other
+    # handler runs; /del N and /purge delete from this index.
+    application.add_handler(MessageHandler(filters.UpdateType.MESSAGE & filters.ChatType.GROUPS, record_message), group=-1)
+
+    # Group -1 so it sees every member update, including those say_goodbye
+    # handles.
+    application.add_handler(
+        ChatMemberHandler(track_admin_changes, ChatMemberHandler.ANY_CHAT_MEMBER),
+        group=-1,
+    )
+
     application.add_handler(
         ChatMemberHandler(
             say_goodbye, 
@@ -106,11 +130,21 @@ async def start_application():
 
     await application.initialize()
     await application.start()
+    await scratch_space.start()
+    await youtube_workers.start()
+    await download_queue.start(application.bot)
     return application
 
 async def stop_application(application):
+    await download_queue.stop()
+    await scratch_space.stop()
     await application.stop()
     await application.shutdown()
+    transcode_service.shutdown()
+    youtube_workers.shutdown()
+    video_compressor.shutdown()
+    for cache in (demo_cache, youtube_file_cache, youtube_metadata_cache):
+        cache.flush()
 
 def signal_handler(signum, frame):
     raise KeyboardInterrupt
@@ -123,7 +157,8 @@ async def main():
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     try:
-        await application.updater.start_polling()
+        # chat_member updates are only delivered when asked for explicitly.
+        await application.updater.start_polling(allowed_updates=Update.ALL_TYPES)
         while True:
             await asyncio.sleep(1)
     except KeyboardInterrupt:
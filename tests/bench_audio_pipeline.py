@@ -0,0 +1,93 @@
+"""
+Compares end-to-end demo latency of the serial path (download to disk,
+create_audio_demo, read the .ogg back for upload) against the streaming
+pipeline (download chunks piped straight into ffmpeg, demo kept in memory).
+
+The Telegram download is simulated by reading a local file at a fixed rate.
+
+Usage:
+    python -m tests.bench_audio_pipeline track.mp3 --rate 2 --start 0 --runs 3
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from bot.utils.audio_demo_creator import (
+    DEMO_DURATION,
+    STREAM_CHUNK_SIZE,
+    create_audio_demo,
+    run_demo_pipeline,
+)
+
+
+async def simulated_download(path, rate_bytes, counter):
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            await asyncio.sleep(len(chunk) / rate_bytes)
+            counter[0] += len(chunk)
+            yield chunk
+
+
+async def serial_path(path, rate_bytes, start, workdir):
+    counter = [0]
+    local_path = os.path.join(workdir, os.path.basename(path))
+    with open(local_path, 'wb') as out:
+        async for chunk in simulated_download(path, rate_bytes, counter):
+            out.write(chunk)
+    demo_path, _ = await asyncio.to_thread(create_audio_demo, local_path, start, DEMO_DURATION)
+    with open(demo_path, 'rb') as f:
+        demo = f.read()
+    os.remove(demo_path)
+    os.remove(local_path)
+    return len(demo), counter[0]
+
+
+async def streaming_path(path, rate_bytes, start):
+    counter = [0]
+    chunks = simulated_download(path, rate_bytes, counter)
+    try:
+        demo = await run_demo_pipeline(chunks, start, DEMO_DURATION)
+    finally:
+        await chunks.aclose()
+    return len(demo), counter[0]
+
+
+async def main(args):
+    rate_bytes = args.rate * 1024 * 1024
+    workdir = tempfile.mkdtemp(prefix="bench_audio_")
+    results = {"serial": [], "streaming": []}
+    try:
+        for _ in range(args.runs):
+            began = time.perf_counter()
+            size, transferred = await serial_path(args.track, rate_bytes, args.start, workdir)
+            results["serial"].append((time.perf_counter() - began, size, transferred))
+
+            began = time.perf_counter()
+            size, transferred = await streaming_path(args.track, rate_bytes, args.start)
+            results["streaming"].append((time.perf_counter() - began, size, transferred))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    track_size = os.path.getsize(args.track)
+    print(f"track: {args.track} ({track_size / 1024 / 1024:.1f} MB), "
+          f"download rate: {args.rate} MB/s, start: {args.start}s")
+    for name, runs in results.items():
+        latency = statistics.median(run[0] for run in runs)
+        print(f"{name:>10}: median {latency:6.2f}s  demo {runs[0][1] / 1024:.0f} KB  "
+              f"downloaded {runs[0][2] / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("track")
+    parser.add_argument("--rate", type=float, default=2.0, help="simulated download rate in MB/s")
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,121 @@
+"""
+Benchmark for the warm yt-dlp worker pool against the per-call setup the
+downloader used before (a new YoutubeDL, and its extractor, for every job).
+
+Offline, it compares the setup cost a job pays before it can talk to YouTube:
+    cold process - a fresh interpreter importing yt_dlp and building YoutubeDL
+    per call     - a new YoutubeDL plus YouTube extractor, yt_dlp already imported
+    warm pool    - a round trip to a youtube_workers process that has both ready
+
+With --url it also measures time-to-first-byte of a real download: from
+submitting the job to the first progress hook reporting downloaded bytes.
+
+Usage:
+    python -m tests.bench_ytdlp_workers --runs 5
+    python -m tests.bench_ytdlp_workers --runs 3 --url https://youtu.be/xxxxxxxxxxx
+"""
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import yt_dlp
+
+from bot.utils.ytdlp_workers import YDL_OPTIONS, YtDlpWorkerPool, youtube_dl
+
+COLD_PROCESS_SCRIPT = (
+    "import yt_dlp; "
+    "ydl = yt_dlp.YoutubeDL({'quiet': True}); "
+    "ydl.get_info_extractor('Youtube')"
+)
+
+
+class FirstByte(Exception):
+    pass
+
+
+def per_call_setup(cancel_event=None):
+    began = time.perf_counter()
+    with yt_dlp.YoutubeDL(dict(YDL_OPTIONS)) as ydl:
+        ydl.get_info_extractor('Youtube')
+    return time.perf_counter() - began
+
+
+def warm_setup(cancel_event=None):
+    began = time.perf_counter()
+    with youtube_dl(tempfile.gettempdir(), None, cancel_event) as ydl:
+        ydl.get_info_extractor('Youtube')
+    return time.perf_counter() - began
+
+
+def time_to_first_byte(url, submitted_at, cancel_event=None):
+    # time.time() rather than perf_counter: the clock has to agree across
+    # processes.
+    def on_progress(progress):
+        if progress.get('downloaded_bytes'):
+            raise FirstByte()
+
+    with tempfile.TemporaryDirectory() as workdir, youtube_dl(workdir, None, cancel_event) as ydl:
+        ydl.add_progress_hook(on_progress)
+        try:
+            ydl.extract_info(url, download=True)
+        except FirstByte:
+            return time.time() - submitted_at
+        except yt_dlp.utils.DownloadError as e:
+            if isinstance(e.exc_info[1], FirstByte):
+                return time.time() - submitted_at
+            raise
+        finally:
+            ydl._progress_hooks.remove(on_progress)
+    raise RuntimeError("download finished without reporting progress")
+
+
+def report(name, samples):
+    samples = sorted(samples)
+    print(f"{name:>14}: median {statistics.median(samples) * 1000:8.1f} ms, "
+          f"min {samples[0] * 1000:8.1f} ms, max {samples[-1] * 1000:8.1f} ms")
+
+
+async def main(args):
+    cold = []
+    for _ in range(args.runs):
+        began = time.perf_counter()
+        subprocess.run([sys.executable, "-c", COLD_PROCESS_SCRIPT], check=True)
+        cold.append(time.perf_counter() - began)
+    report("cold process", cold)
+
+    loop = asyncio.get_running_loop()
+    per_call = [await loop.run_in_executor(None, per_call_setup) for _ in range(args.runs)]
+    report("per call", per_call)
+
+    pool = YtDlpWorkerPool(max_workers=1, job_timeout=600)
+    began = time.perf_counter()
+    await pool.start()
+    print(f"{'pool start':>14}: {(time.perf_counter() - began) * 1000:8.1f} ms (paid once at bot startup)")
+    warm = []
+    for _ in range(args.runs):
+        began = time.perf_counter()
+        await pool.run(warm_setup)
+        warm.append(time.perf_counter() - began)
+    report("warm pool", warm)
+
+    if args.url:
+        per_call_ttfb = [
+            await loop.run_in_executor(None, time_to_first_byte, args.url, time.time())
+            for _ in range(args.runs)
+        ]
+        report("ttfb per call", per_call_ttfb)
+        warm_ttfb = [await pool.run(time_to_first_byte, args.url, time.time()) for _ in range(args.runs)]
+        report("ttfb warm", warm_ttfb)
+
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--url", help="also measure time-to-first-byte downloading this video")
+    asyncio.run(main(parser.parse_args()))
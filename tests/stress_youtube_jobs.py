@@ -0,0 +1,104 @@
+"""
+Stress test for the yt-dlp worker pool: measures how long a moderation-style
+command waits for the event loop while five downloads are in progress.
+
+Three scenarios are compared:
+    idle      - no downloads running
+    workers   - five downloads on a YtDlpWorkerPool (the current handler path)
+    blocking  - the same five downloads called on the event loop (the old path)
+
+Downloads are simulated by a function that behaves like yt-dlp: it alternates
+short bursts of Python work with blocking socket waits and polls cancel_event.
+Pass --url to use real download_youtube_video calls instead.
+
+Usage:
+    python -m tests.stress_youtube_jobs --seconds 5
+    python -m tests.stress_youtube_jobs --url https://youtu.be/xxxxxxxxxxx
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+from bot.utils.ytdlp_workers import YtDlpWorkerPool
+
+DOWNLOADS = 5
+PROBE_INTERVAL = 0.05
+
+
+def simulated_download(seconds, cancel_event=None):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        if cancel_event is not None and cancel_event.is_set():
+            return "cancelled"
+        sum(i * i for i in range(2000))
+        time.sleep(0.01)
+    return "done"
+
+
+async def probe_command_latency(stop):
+    latencies = []
+    while not stop.is_set():
+        scheduled = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        latencies.append(time.perf_counter() - scheduled - PROBE_INTERVAL)
+    return latencies
+
+
+async def run_scenario(name, downloads):
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_command_latency(stop))
+    began = time.perf_counter()
+    await downloads()
+    elapsed = time.perf_counter() - began
+    stop.set()
+    latencies = sorted(await probe) or [0.0]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:>9}: {elapsed:6.2f}s total, command latency "
+          f"p50 {statistics.median(latencies) * 1000:7.1f} ms, "
+          f"p99 {p99 * 1000:7.1f} ms, max {latencies[-1] * 1000:7.1f} ms")
+
+
+async def main(args):
+    workers = YtDlpWorkerPool(max_workers=DOWNLOADS, job_timeout=600)
+    await workers.start()
+    workdir = tempfile.mkdtemp(prefix="stress_youtube_")
+
+    # Jobs cross a process boundary, so they are a module-level function
+    # plus arguments rather than closures.
+    if args.url:
+        from bot.utils.youtube_downloader import download_youtube_video
+        job = (download_youtube_video, args.url, workdir)
+    else:
+        job = (simulated_download, args.seconds)
+
+    async def idle():
+        await asyncio.sleep(args.seconds)
+
+    async def with_workers():
+        await asyncio.gather(*(workers.run(*job) for _ in range(DOWNLOADS)))
+
+    async def blocking():
+        for _ in range(DOWNLOADS):
+            job[0](*job[1:])
+            await asyncio.sleep(0)
+
+    await run_scenario("idle", idle)
+    await run_scenario("workers", with_workers)
+    if not args.url:
+        await run_scenario("blocking", blocking)
+
+    began = time.perf_counter()
+    try:
+        await workers.run(*job, timeout=0.5)
+    except asyncio.TimeoutError:
+        print(f"timeout: job cancelled after {time.perf_counter() - began:.2f}s")
+    workers.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5.0, help="length of each simulated download")
+    parser.add_argument("--url", help="download this video for real instead of simulating")
+    asyncio.run(main(parser.parse_args()))
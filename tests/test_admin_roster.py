@@ -0,0 +1,85 @@
+import asyncio
+from types import SimpleNamespace
+
+from bot.utils.admin_roster import AdminRosterCache
+
+def member(user_id, status="administrator"):
+    return SimpleNamespace(user=SimpleNamespace(id=user_id), status=status)
+
+class FakeBot:
+    def __init__(self, members, delay=0):
+        self.members = members
+        self.delay = delay
+        self.calls = 0
+
+    async def get_chat_administrators(self, chat_id):
+        self.calls += 1
+        members = list(self.members)
+        await asyncio.sleep(self.delay)
+        return members
+
+def member_update(chat_id, old_status, new_status):
+    return SimpleNamespace(
+        chat=SimpleNamespace(id=chat_id),
+        old_chat_member=SimpleNamespace(status=old_status),
+        new_chat_member=SimpleNamespace(status=new_status),
+    )
+
+def test_roster_is_cached():
+    async def main():
+        cache = AdminRosterCache(ttl=60)
+        bot = FakeBot([member(1, "creator"), member(2)])
+        results = [await cache.is_admin(bot, 5, user_id) for user_id in (1, 2, 3)]
+        return results, bot.calls, cache.stats()
+
+    results, calls, stats = asyncio.run(main())
+    assert results == [True, True, False]
+    assert calls == 1
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+
+def test_concurrent_misses_share_one_call():
+    async def main():
+        cache = AdminRosterCache(ttl=60)
+        bot = FakeBot([member(1)], delay=0.01)
+        await asyncio.gather(*(cache.admins(bot, 5) for _ in range(5)))
+        return bot.calls
+
+    assert asyncio.run(main()) == 1
+
+def test_expired_roster_is_reloaded():
+    async def main():
+        cache = AdminRosterCache(ttl=0)
+        bot = FakeBot([member(1)])
+        await cache.admins(bot, 5)
+        await cache.admins(bot, 5)
+        return bot.calls
+
+    assert asyncio.run(main()) == 2
+
+def test_admin_change_invalidates():
+    async def main():
+        cache = AdminRosterCache(ttl=60)
+        bot = FakeBot([member(1)])
+        assert not await cache.is_admin(bot, 5, 2)
+        # Ordinary members joining do not touch the roster.
+        cache.member_changed(member_update(5, "left", "member"))
+        bot.members.append(member(2))
+        assert not await cache.is_admin(bot, 5, 2)
+        cache.member_changed(member_update(5, "member", "administrator"))
+        assert await cache.is_admin(bot, 5, 2)
+        return bot.calls, cache.stats()["invalidations"]
+
+    assert asyncio.run(main()) == (2, 1)
+
+def test_load_overtaken_by_invalidation_is_not_cached():
+    async def main():
+        cache = AdminRosterCache(ttl=60)
+        bot = FakeBot([member(1)], delay=0.01)
+        load = asyncio.create_task(cache.admins(bot, 5))
+        await asyncio.sleep(0)
+        bot.members.append(member(2))
+        cache.invalidate(5)
+        await load
+        return await cache.is_admin(bot, 5, 2), bot.calls
+
+    assert asyncio.run(main()) == (True, 2)
@@ -0,0 +1,34 @@
+import pytest
+
+from bot.utils.bandwidth import BandwidthScheduler
+
+def make_scheduler(total_rate=1000, headroom=100, min_rate=50):
+    return BandwidthScheduler(total_rate=total_rate, headroom=headroom, min_rate=min_rate)
+
+def test_equal_priorities_split_the_budget():
+    assert make_scheduler().shares({1: 0, 2: 0, 3: 0}) == {1: 300, 2: 300, 3: 300}
+
+def test_admin_priority_gets_twice_the_share():
+    shares = make_scheduler(total_rate=400, headroom=100).shares({1: 0, 2: 10})
+    assert shares == {1: 100, 2: 200}
+
+def test_shares_never_drop_below_the_minimum():
+    shares = make_scheduler().shares({token: 0 for token in range(100)})
+    assert set(shares.values()) == {50}
+
+def test_no_total_rate_means_no_limit():
+    assert make_scheduler(total_rate=None).shares({1: 0}) == {1: None}
+
+def test_jobs_are_rebalanced_on_add_and_remove():
+    scheduler = make_scheduler()
+    first, second = {"rate": None}, {"rate": None, "downloaded": 450}
+    first_token = scheduler.add(first, 0)
+    assert first["rate"] == 900
+    second_token = scheduler.add(second, 0)
+    assert (first["rate"], second["rate"]) == (450, 450)
+    scheduler.remove(second_token, "job", 1.0)
+    assert first["rate"] == 900
+    stats = scheduler.stats()
+    assert (stats["active_jobs"], stats["jobs"], stats["downloaded"]) == (1, 1, 450)
+    assert stats["recent"][0]["throughput"] == pytest.approx(450)
+    scheduler.remove(first_token, "job", 1.0)
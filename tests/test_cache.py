@@ -0,0 +1,58 @@
+import asyncio
+import json
+import time
+
+from bot.utils import cache as cache_module
+from bot.utils.cache import PersistentLRUCache
+
+def test_evicts_the_least_recently_used(tmp_path):
+    cache = PersistentLRUCache(str(tmp_path / "cache.json"), max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = PersistentLRUCache(str(tmp_path / "cache.json"), max_entries=10, ttl=60)
+    cache.set("a", 1)
+    cache._entries["a"] = (1, time.time() - 61)
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 1
+    assert len(cache) == 0
+
+def test_expired_entries_are_dropped_on_load(tmp_path):
+    path = tmp_path / "cache.json"
+    path.write_text(json.dumps([["old", 1, time.time() - 120], ["new", 2, time.time()]]))
+    cache = PersistentLRUCache(str(path), max_entries=10, ttl=60)
+    assert (cache.get("old"), cache.get("new")) == (None, 2)
+
+def test_recency_survives_a_reload(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = PersistentLRUCache(path, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    reloaded = PersistentLRUCache(path, max_entries=2)
+    reloaded.set("c", 3)
+    assert reloaded.get("b") is None
+    assert reloaded.get("a") == 1
+
+def test_saves_are_batched_off_the_loop(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_module, "CACHE_SAVE_DELAY", 0.05)
+    path = tmp_path / "cache.json"
+    cache = PersistentLRUCache(str(path), max_entries=10)
+    writes = []
+    write = cache._write
+    monkeypatch.setattr(cache, "_write", lambda rows, version: (writes.append(version), write(rows, version)))
+
+    async def main():
+        for index in range(5):
+            cache.set(f"key{index}", index)
+        assert not path.exists()
+        await asyncio.sleep(0.2)
+
+    asyncio.run(main())
+    assert len(writes) == 1
+    assert [row[0] for row in json.loads(path.read_text())] == [f"key{index}" for index in range(5)]
@@ -0,0 +1,31 @@
+from bot.utils import cooldown as cooldown_module
+from bot.utils.cooldown import CooldownManager
+
+def test_claim_takes_the_slot_once(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cooldown_module.time, "time", lambda: now[0])
+    cooldown = CooldownManager(60)
+    assert cooldown.claim(1) == 0
+    now[0] += 15
+    assert cooldown.claim(1) == 45
+    # Another user is not affected.
+    assert cooldown.claim(2) == 0
+    now[0] += 45
+    assert cooldown.claim(1) == 0
+
+def test_waiting_does_not_restart_the_cooldown(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cooldown_module.time, "time", lambda: now[0])
+    cooldown = CooldownManager(60)
+    cooldown.claim(1)
+    now[0] += 30
+    cooldown.claim(1)
+    now[0] += 30
+    assert cooldown.claim(1) == 0
+
+def test_release_gives_the_slot_back():
+    cooldown = CooldownManager(60)
+    assert cooldown.claim(1) == 0
+    cooldown.release(1)
+    assert cooldown.claim(1) == 0
+    cooldown.release(2)
@@ -0,0 +1,23 @@
+import numpy as np
+
+from bot.utils.demo_selection import find_best_start
+
+SAMPLE_RATE = 1000
+
+def track(seconds, loud_from, loud_seconds):
+    samples = np.full(seconds * SAMPLE_RATE, 0.01, dtype=np.float32)
+    samples[loud_from * SAMPLE_RATE:(loud_from + loud_seconds) * SAMPLE_RATE] = 0.8
+    return samples
+
+def test_finds_the_loud_section():
+    assert find_best_start(track(120, 60, 30), SAMPLE_RATE, 30) == 60
+
+def test_short_track_starts_at_zero():
+    assert find_best_start(track(20, 5, 5), SAMPLE_RATE, 30) == 0
+
+def test_silence_starts_at_zero():
+    assert find_best_start(np.zeros(120 * SAMPLE_RATE, dtype=np.float32), SAMPLE_RATE, 30) == 0
+
+def test_window_never_runs_past_the_end():
+    start = find_best_start(track(100, 90, 10), SAMPLE_RATE, 30)
+    assert start + 30 <= 100
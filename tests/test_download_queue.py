@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+from bot.utils.download_queue import DownloadQueue, ADMIN_PRIORITY, DONE, FAILED, PENDING
+
+def make_queue(tmp_path, max_attempts=3):
+    return DownloadQueue(str(tmp_path / "queue.sqlite3"), worker_slots=1, max_attempts=max_attempts)
+
+def scheduled_ids(queue):
+    return [row["id"] for row in queue._schedule()]
+
+def status_of(queue, job_id):
+    return queue._connect().execute("SELECT status, attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+def test_higher_priority_goes_first(tmp_path):
+    queue = make_queue(tmp_path)
+    regular = queue.enqueue("youtube", 1, 10, {})
+    admin = queue.enqueue("youtube", 1, 11, {}, priority=ADMIN_PRIORITY)
+    assert scheduled_ids(queue) == [admin, regular]
+    assert queue.position(admin) == 1
+
+def test_chats_take_turns(tmp_path):
+    queue = make_queue(tmp_path)
+    a1 = queue.enqueue("youtube", 1, 10, {})
+    a2 = queue.enqueue("youtube", 1, 10, {})
+    a3 = queue.enqueue("youtube", 1, 10, {})
+    b1 = queue.enqueue("youtube", 2, 20, {})
+    assert scheduled_ids(queue) == [a1, b1, a2, a3]
+
+def test_users_in_a_chat_take_turns(tmp_path):
+    queue = make_queue(tmp_path)
+    a1 = queue.enqueue("youtube", 1, 10, {})
+    a2 = queue.enqueue("youtube", 1, 10, {})
+    b1 = queue.enqueue("youtube", 1, 11, {})
+    assert scheduled_ids(queue) == [a1, b1, a2]
+
+def test_claimed_chat_waits_for_the_others(tmp_path):
+    queue = make_queue(tmp_path)
+    a1 = queue.enqueue("youtube", 1, 10, {})
+    a2 = queue.enqueue("youtube", 1, 10, {})
+    assert queue._claim_next()["id"] == a1
+    b1 = queue.enqueue("youtube", 2, 20, {})
+    assert scheduled_ids(queue) == [b1, a2]
+
+def test_failed_job_is_retried_later(tmp_path):
+    queue = make_queue(tmp_path)
+
+    async def handler(bot, job):
+        raise RuntimeError("boom")
+
+    queue.register("youtube", handler)
+    job_id = queue.enqueue("youtube", 1, 10, {"status_message_id": 5, "status_text": ""})
+    asyncio.run(queue._run(None, queue._claim_next()))
+    assert tuple(status_of(queue, job_id)) == (PENDING, 1)
+    # Backed off: not eligible now, eligible once the delay has passed.
+    assert scheduled_ids(queue) == []
+    assert [row["id"] for row in queue._schedule(now=time.time() + 3600)] == [job_id]
+
+def test_job_fails_after_max_attempts(tmp_path):
+    queue = make_queue(tmp_path, max_attempts=1)
+    failures = []
+
+    async def handler(bot, job):
+        raise RuntimeError("boom")
+
+    async def on_failure(bot, job, error):
+        failures.append((job["id"], str(error)))
+
+    queue.register("youtube", handler, on_failure)
+    job_id = queue.enqueue("youtube", 1, 10, {})
+    asyncio.run(queue._run(None, queue._claim_next()))
+    assert tuple(status_of(queue, job_id)) == (FAILED, 1)
+    assert failures == [(job_id, "boom")]
+
+def test_successful_job_is_done(tmp_path):
+    queue = make_queue(tmp_path)
+
+    async def handler(bot, job):
+        pass
+
+    queue.register("youtube", handler)
+    job_id = queue.enqueue("youtube", 1, 10, {})
+    asyncio.run(queue._run(None, queue._claim_next()))
+    assert tuple(status_of(queue, job_id)) == (DONE, 1)
+    assert queue._claim_next() is None
+
+def test_worker_survives_a_failing_iteration(tmp_path):
+    queue = make_queue(tmp_path, max_attempts=1)
+    done = []
+
+    async def handler(bot, job):
+        if job["payload"].get("bad"):
+            raise RuntimeError("boom")
+        done.append(job["id"])
+
+    async def on_failure(bot, job, error):
+        raise ValueError("notification failed")
+
+    queue.register("youtube", handler, on_failure)
+    queue.enqueue("youtube", 1, 10, {"bad": True})
+    good = queue.enqueue("youtube", 1, 10, {})
+
+    async def main():
+        await queue.start(None)
+        for _ in range(100):
+            if done:
+                break
+            await asyncio.sleep(0.01)
+        await queue.stop()
+
+    asyncio.run(main())
+    assert done == [good]
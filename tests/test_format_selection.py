@@ -0,0 +1,72 @@
+import pytest
+
+from bot.utils.youtube_downloader import MAX_UPLOAD_SIZE, VideoTooLargeError, select_audio_format, select_format
+
+MB = 1024 * 1024
+
+def video(format_id, height, size, vcodec="avc1.4d401f", ext="mp4", acodec="none", tbr=1000):
+    return {"format_id": format_id, "height": height, "filesize": size, "vcodec": vcodec, "ext": ext, "acodec": acodec, "tbr": tbr}
+
+def audio(format_id, size, acodec="mp4a.40.2", ext="m4a", abr=128):
+    return {"format_id": format_id, "filesize": size, "vcodec": "none", "acodec": acodec, "ext": ext, "abr": abr}
+
+def info(*formats, duration=300):
+    return {"duration": duration, "formats": list(formats)}
+
+def test_picks_the_highest_quality_that_fits():
+    formats = info(video("137", 1080, 80 * MB), video("136", 720, 30 * MB), video("135", 480, 15 * MB), audio("140", 5 * MB))
+    assert select_format(formats, MAX_UPLOAD_SIZE) == ("136+140", 35 * MB)
+
+def test_respects_max_height():
+    formats = info(video("136", 720, 30 * MB), video("135", 480, 15 * MB), audio("140", 5 * MB))
+    assert select_format(formats, MAX_UPLOAD_SIZE, max_height=480)[0] == "135+140"
+
+def test_falls_back_to_a_progressive_format():
+    formats = info(video("18", 360, 20 * MB, acodec="mp4a.40.2"))
+    assert select_format(formats, MAX_UPLOAD_SIZE) == ("18", 20 * MB)
+
+def test_estimates_size_from_bitrate():
+    estimated = {"format_id": "18", "height": 360, "vcodec": "avc1", "acodec": "mp4a", "tbr": 800}
+    format_id, size = select_format(info(estimated, duration=100), MAX_UPLOAD_SIZE)
+    assert (format_id, size) == ("18", 800 * 1000 / 8 * 100)
+
+def test_too_large_reports_the_smallest_size():
+    formats = info(video("137", 1080, 120 * MB), video("136", 720, 70 * MB), audio("140", 5 * MB))
+    with pytest.raises(VideoTooLargeError) as error:
+        select_format(formats, MAX_UPLOAD_SIZE)
+    assert error.value.smallest_size == 75 * MB
+
+def test_audio_prefers_m4a_over_opus():
+    formats = info(
+        video("18", 360, 20 * MB, acodec="mp4a.40.2"),
+        audio("251", 4 * MB, acodec="opus", ext="webm", abr=130),
+        audio("249", 1 * MB, acodec="opus", ext="webm", abr=50),
+        audio("140", 5 * MB),
+    )
+    assert select_audio_format(formats, MAX_UPLOAD_SIZE) == ("140", 5 * MB)
+
+def test_audio_takes_the_smallest_good_enough_stream():
+    formats = info(audio("140", 5 * MB, abr=128), audio("139", 2 * MB, abr=48), audio("141", 10 * MB, abr=256))
+    assert select_audio_format(formats, MAX_UPLOAD_SIZE)[0] == "140"
+
+def test_audio_falls_back_to_opus():
+    formats = info(audio("251", 4 * MB, acodec="opus", ext="webm"))
+    assert select_audio_format(formats, MAX_UPLOAD_SIZE)[0] == "251"
+    with pytest.raises(VideoTooLargeError):
+        select_audio_format(info(video("18", 360, 20 * MB, acodec="mp4a.40.2")), MAX_UPLOAD_SIZE)
+
+def test_prefers_h264_at_equal_height():
+    formats = info(
+        video("247", 720, 25 * MB, vcodec="vp9", ext="webm", tbr=1500),
+        video("136", 720, 30 * MB, tbr=1200),
+        audio("140", 5 * MB),
+    )
+    assert select_format(formats, MAX_UPLOAD_SIZE)[0] == "136+140"
+
+def test_takes_vp9_when_h264_does_not_fit():
+    formats = info(
+        video("247", 720, 39 * MB, vcodec="vp9", ext="webm"),
+        video("136", 720, 54 * MB),
+        audio("140", 5 * MB),
+    )
+    assert select_format(formats, MAX_UPLOAD_SIZE)[0] == "247+140"
@@ -0,0 +1,45 @@
+from bot.utils.link_extractor import (
+    extract_video_ids, has_youtube_link, canonical_video_url, is_video_id, MAX_LINKS_PER_MESSAGE,
+)
+
+VIDEO_ID = "dQw4w9WgXcQ"
+
+def test_recognises_every_link_form():
+    links = [
+        f"https://www.youtube.com/watch?v={VIDEO_ID}",
+        f"https://m.youtube.com/watch?feature=share&v={VIDEO_ID}",
+        f"https://music.youtube.com/watch?v={VIDEO_ID}&list=x",
+        f"https://youtu.be/{VIDEO_ID}?t=10",
+        f"youtube.com/shorts/{VIDEO_ID}",
+        f"https://www.youtube-nocookie.com/embed/{VIDEO_ID}",
+        f"https://www.youtube.com/live/{VIDEO_ID}",
+        f"HTTPS://WWW.YOUTUBE.COM/v/{VIDEO_ID}",
+    ]
+    for link in links:
+        assert extract_video_ids(f"look: {link} !") == [VIDEO_ID], link
+
+def test_video_id_keeps_its_case():
+    assert extract_video_ids("https://youtu.be/AbCdEfGhIjK") == ["AbCdEfGhIjK"]
+
+def test_rejects_non_links():
+    assert extract_video_ids(None) == []
+    assert extract_video_ids("hello there") == []
+    assert extract_video_ids("https://youtube.com/channel/abc") == []
+    # One character too long is not a video id.
+    assert extract_video_ids(f"https://youtu.be/{VIDEO_ID}x") == []
+    assert not has_youtube_link("https://example.com/watch?v=" + VIDEO_ID)
+
+def test_deduplicates_and_limits():
+    ids = [f"video{index:06d}" for index in range(MAX_LINKS_PER_MESSAGE + 2)]
+    text = " ".join(f"https://youtu.be/{video_id}" for video_id in [ids[0]] + ids)
+    assert extract_video_ids(text) == ids[:MAX_LINKS_PER_MESSAGE]
+
+def test_canonical_url_round_trips():
+    assert extract_video_ids(canonical_video_url(VIDEO_ID)) == [VIDEO_ID]
+    assert has_youtube_link(canonical_video_url(VIDEO_ID))
+
+def test_is_video_id():
+    assert is_video_id(VIDEO_ID)
+    assert not is_video_id(VIDEO_ID[:10])
+    assert not is_video_id(VIDEO_ID + "x")
+    assert not is_video_id("../../etc/pa")
@@ -0,0 +1,34 @@
+from bot.utils.message_index import MessageIndex, MessageRing
+
+def test_ring_keeps_the_newest_messages():
+    ring = MessageRing(3)
+    for message_id in range(1, 6):
+        ring.add(message_id, 100 + message_id)
+    assert [ring.message_ids[slot] for slot in ring.newest_first()] == [5, 4, 3]
+    assert ring.count == 3
+
+def test_ring_skips_forgotten_messages():
+    ring = MessageRing(4)
+    for message_id in range(1, 5):
+        ring.add(message_id, 7)
+    ring.forget({2, 4})
+    assert [ring.message_ids[slot] for slot in ring.newest_first()] == [3, 1]
+
+def test_index_last_and_before():
+    index = MessageIndex(10)
+    for message_id in range(1, 8):
+        index.record(1, message_id, 7)
+    assert index.last(1, 3) == [7, 6, 5]
+    assert index.last(1, 2, before=5) == [4, 3]
+    assert index.last(2, 3) == []
+
+def test_index_from_user_and_forget():
+    index = MessageIndex(10)
+    index.record(1, 1, 7)
+    index.record(1, 2, 8)
+    index.record(1, 3, 7)
+    index.record(2, 4, 7)
+    assert index.from_user(1, 7) == [3, 1]
+    index.forget(1, [3])
+    assert index.from_user(1, 7) == [1]
+    assert index.stats() == {"chats": 2, "messages": 4}
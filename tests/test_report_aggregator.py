@@ -0,0 +1,124 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest
+
+from bot.utils import report_aggregator as aggregator_module
+from bot.utils.report_aggregator import ReportAggregator, NEW, ADDED, DUPLICATE
+
+REPORTED = SimpleNamespace(id=5, full_name="Spammer")
+
+class FakeBot:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+        self.edits = []
+        self.deleted = set()
+        self.texts = {}
+
+    async def send_message(self, **kwargs):
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError("send failed")
+        self.sent.append(kwargs)
+        message_id = 900 + len(self.sent)
+        self.texts[message_id] = kwargs["text"]
+        return SimpleNamespace(message_id=message_id)
+
+    async def edit_message_text(self, chat_id, message_id, text, parse_mode=None):
+        if message_id in self.deleted:
+            raise BadRequest("Message to edit not found")
+        if self.texts[message_id] == text:
+            raise BadRequest("Message is not modified")
+        self.texts[message_id] = text
+        self.edits.append(message_id)
+
+@pytest.fixture(autouse=True)
+def admins(monkeypatch):
+    async def admins(bot, chat_id):
+        return {1: SimpleNamespace(user=SimpleNamespace(id=1, is_bot=False))}
+
+    monkeypatch.setattr(aggregator_module.admin_roster, "admins", admins)
+
+def test_reports_join_one_notification():
+    async def main():
+        aggregator = ReportAggregator(window=60)
+        bot = FakeBot()
+        results = [
+            await aggregator.report(bot, 1, REPORTED, reporter_id, message_id)
+            for reporter_id, message_id in [(10, 100), (11, 100), (11, 100), (11, 101)]
+        ]
+        return results, bot, aggregator
+
+    results, bot, aggregator = asyncio.run(main())
+    assert results == [NEW, ADDED, DUPLICATE, ADDED]
+    assert len(bot.sent) == 1
+    assert bot.sent[0]["reply_to_message_id"] == 100
+    assert bot.edits == [901, 901]
+    assert aggregator.stats() == {"open": 1, "reports": 4, "notifications": 1}
+
+def test_duplicates_are_per_reporter_and_message():
+    async def main():
+        aggregator = ReportAggregator(window=60)
+        bot = FakeBot()
+        await aggregator.report(bot, 1, REPORTED, 10, 100)
+        await aggregator.report(bot, 1, REPORTED, 11, 101)
+        # 10 never reported 101, even though both were seen separately.
+        return await aggregator.report(bot, 1, REPORTED, 10, 101)
+
+    assert asyncio.run(main()) == ADDED
+
+def test_reports_during_the_first_send_wait_for_it():
+    async def main():
+        aggregator = ReportAggregator(window=60)
+        bot = FakeBot()
+        return await asyncio.gather(
+            aggregator.report(bot, 1, REPORTED, 10, 100), aggregator.report(bot, 1, REPORTED, 11, 100)
+        ), bot
+
+    results, bot = asyncio.run(main())
+    assert results == [NEW, ADDED]
+    assert len(bot.sent) == 1
+
+def test_failed_send_fails_waiting_reports():
+    async def main():
+        aggregator = ReportAggregator(window=60)
+        bot = FakeBot(fail=True)
+        results = await asyncio.gather(
+            aggregator.report(bot, 1, REPORTED, 10, 100),
+            aggregator.report(bot, 1, REPORTED, 11, 100),
+            return_exceptions=True,
+        )
+        return results, aggregator.stats()["open"]
+
+    results, still_open = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert still_open == 0
+
+def test_deleted_notification_is_sent_again():
+    async def main():
+        aggregator = ReportAggregator(window=60)
+        bot = FakeBot()
+        await aggregator.report(bot, 1, REPORTED, 10, 100)
+        bot.deleted.add(901)
+        result = await aggregator.report(bot, 1, REPORTED, 11, 100)
+        await aggregator.report(bot, 1, REPORTED, 12, 100)
+        return result, bot
+
+    result, bot = asyncio.run(main())
+    assert result == ADDED
+    assert len(bot.sent) == 2
+    assert bot.edits == [902]
+
+def test_window_runs_from_the_first_report():
+    async def main():
+        aggregator = ReportAggregator(window=0.3)
+        bot = FakeBot()
+        results = []
+        for reporter_id in (10, 11, 12):
+            results.append(await aggregator.report(bot, 1, REPORTED, reporter_id, 100))
+            await asyncio.sleep(0.2)
+        return results
+
+    assert asyncio.run(main()) == [NEW, ADDED, NEW]
@@ -0,0 +1,90 @@
+import asyncio
+import os
+
+import pytest
+
+from bot.utils.scratch import ScratchManager, ScratchQuotaExceeded
+
+def make_scratch(tmp_path, quota=1000):
+    # No tmpfs parent: the disk directory is used.
+    return ScratchManager(str(tmp_path / "missing" / "tmpfs"), str(tmp_path / "disk"), quota, max_age=3600)
+
+def test_job_dir_is_removed_and_released(tmp_path):
+    scratch = make_scratch(tmp_path)
+
+    async def main():
+        async with scratch.job_dir(400) as path:
+            with open(os.path.join(path, "file"), "wb") as f:
+                f.write(b"x")
+            assert scratch.reserved == 400
+        return path
+
+    path = asyncio.run(main())
+    assert not os.path.exists(path)
+    assert scratch.reserved == 0
+
+def test_oversized_job_is_refused(tmp_path):
+    scratch = make_scratch(tmp_path)
+
+    async def main():
+        async with scratch.job_dir(1001):
+            pass
+
+    with pytest.raises(ScratchQuotaExceeded):
+        asyncio.run(main())
+
+def test_jobs_wait_for_room(tmp_path):
+    scratch = make_scratch(tmp_path)
+    order = []
+
+    async def job(name, size, hold):
+        async with scratch.job_dir(size):
+            order.append(name)
+            await asyncio.sleep(hold)
+
+    async def main():
+        first = asyncio.create_task(job("first", 800, 0.05))
+        await asyncio.sleep(0)
+        await asyncio.gather(first, job("second", 600, 0))
+
+    asyncio.run(main())
+    assert order == ["first", "second"]
+    assert scratch.reserved == 0
+
+def test_shrink_admits_waiting_jobs(tmp_path):
+    scratch = make_scratch(tmp_path)
+
+    async def main():
+        admitted = asyncio.Event()
+
+        async def second():
+            async with scratch.job_dir(600):
+                admitted.set()
+
+        async with scratch.job_dir(800) as path:
+            waiting = asyncio.create_task(second())
+            await asyncio.sleep(0.01)
+            assert not admitted.is_set()
+            await scratch.shrink(path, 300)
+            await asyncio.wait_for(admitted.wait(), 1)
+            await waiting
+            # Growing back is not what shrink is for.
+            await scratch.shrink(path, 900)
+            assert scratch.reserved == 300
+        return scratch.reserved
+
+    assert asyncio.run(main()) == 0
+
+def test_sweep_skips_active_jobs(tmp_path):
+    scratch = make_scratch(tmp_path)
+
+    async def main():
+        async with scratch.job_dir(10) as path:
+            orphan = os.path.join(scratch.disk_path, "orphan")
+            os.makedirs(orphan)
+            with open(os.path.join(orphan, "file"), "wb") as f:
+                f.write(b"12345")
+            reclaimed = scratch.sweep(everything=True)
+            return reclaimed, os.path.exists(path), os.path.exists(orphan)
+
+    assert asyncio.run(main()) == (5, True, False)
@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from bot.utils.single_flight import FlightCancelled, SingleFlight
+
+def test_concurrent_callers_share_one_call():
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        flights = SingleFlight()
+        return await asyncio.gather(*(flights.do("key", work) for _ in range(3)))
+
+    assert asyncio.run(main()) == [("result", False), ("result", True), ("result", True)]
+    assert len(calls) == 1
+
+def test_followers_get_the_leaders_error():
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        flights = SingleFlight()
+        return await asyncio.gather(flights.do("key", work), flights.do("key", work), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, ValueError) for result in results)
+
+def test_cancelled_leader_fails_followers_with_an_ordinary_error():
+    async def main():
+        flights = SingleFlight()
+        leader = asyncio.create_task(flights.do("key", lambda: asyncio.sleep(1)))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do("key", lambda: asyncio.sleep(1)))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        with pytest.raises(FlightCancelled):
+            await follower
+        # The key is free again afterwards.
+        return await flights.do("key", lambda: asyncio.sleep(0, "again"))
+
+    assert asyncio.run(main()) == ("again", False)
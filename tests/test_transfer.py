@@ -0,0 +1,67 @@
+import asyncio
+
+from bot.utils.transfer import FairLimiter, TransferService
+
+def test_limits_per_chat_and_globally():
+    async def main():
+        limiter = FairLimiter(limit=3, per_chat_limit=2)
+        await limiter.acquire(1)
+        await limiter.acquire(1)
+        third = asyncio.create_task(limiter.acquire(1))
+        await limiter.acquire(2)
+        await asyncio.sleep(0)
+        return limiter.active, third.done(), limiter.queued()
+
+    assert asyncio.run(main()) == (3, False, 1)
+
+def test_waiting_chats_take_turns():
+    async def main():
+        limiter = FairLimiter(limit=1, per_chat_limit=1)
+        await limiter.acquire(0)
+        order = []
+
+        async def waiter(chat_id):
+            await limiter.acquire(chat_id)
+            order.append(chat_id)
+
+        tasks = [asyncio.create_task(waiter(chat_id)) for chat_id in (1, 1, 1, 2, 3)]
+        await asyncio.sleep(0)
+        limiter.release(0)
+        for _ in tasks:
+            await asyncio.sleep(0)
+            limiter.release(order[-1])
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(main()) == [1, 2, 3, 1, 1]
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def main():
+        limiter = FairLimiter(limit=1, per_chat_limit=1)
+        await limiter.acquire(1)
+        waiter = asyncio.create_task(limiter.acquire(2))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        limiter.release(1)
+        return limiter.active, limiter.queued()
+
+    assert asyncio.run(main()) == (0, 0)
+
+def test_large_transfers_run_one_at_a_time():
+    async def main():
+        service = TransferService(limit=4, per_chat_limit=4, large_limit=1, large_threshold=100)
+        running = []
+        peak = []
+
+        async def transfer(chat_id, size):
+            async with service.slot(chat_id, size):
+                running.append(size)
+                peak.append(sum(1 for item in running if item >= 100))
+                await asyncio.sleep(0.01)
+                running.remove(size)
+
+        await asyncio.gather(transfer(1, 500), transfer(2, 500), transfer(3, 10))
+        return max(peak), service.metrics()["completed"]
+
+    assert asyncio.run(main()) == (1, 3)